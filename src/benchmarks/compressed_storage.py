@@ -0,0 +1,94 @@
+import argparse
+import tempfile
+import time
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import FakeEmbeddings
+from common.vector_db import IndexPartition, STORAGE_MODES
+
+
+def make_dataset(num_vectors: int, num_queries: int, dimension: int, rng):
+    """
+    Generates clustered normalized vectors, closer to real embeddings than uniform noise, and queries
+    that are perturbed copies of random vectors.
+    """
+    centers = rng.standard_normal((max(num_vectors // 100, 1), dimension)).astype("float32")
+    vectors = centers[rng.integers(0, len(centers), num_vectors)] + 0.5 * rng.standard_normal((num_vectors, dimension)).astype("float32")
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    queries = vectors[rng.integers(0, num_vectors, num_queries)] + 0.1 * rng.standard_normal((num_queries, dimension)).astype("float32")
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    return vectors, queries
+
+
+def build_partition(storage_mode: str, path: str, vectors: np.ndarray, rerank_factor: int, pq_subquantizers: int):
+    """
+    Builds a partition of the given storage mode holding the vectors.
+    """
+    partition = IndexPartition(
+        storage_mode,
+        path,
+        FakeEmbeddings(size=vectors.shape[1]),
+        dimension=vectors.shape[1],
+        storage_mode=storage_mode,
+        rerank_factor=rerank_factor,
+        pq_subquantizers=pq_subquantizers
+    )
+    documents = [Document(page_content=str(i), metadata={"source": str(i)}) for i in range(len(vectors))]
+    partition.add(documents, vectors)
+    # Retrain the quantizer on the whole data set, as the background compaction would
+    partition.compact()
+    return partition
+
+
+def evaluate(partition, queries: np.ndarray, ground_truth, k: int):
+    """
+    Returns the recall@k against the ground truth and the p50/p99 search latency in milliseconds.
+    """
+    latencies = []
+    hits = 0
+    for query, expected in zip(queries, ground_truth):
+        start = time.perf_counter()
+        results = partition.search_by_vector(query.tolist(), k=k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        hits += len(expected & {doc.page_content for doc, _ in results})
+    recall = hits / (k * len(queries))
+    return recall, np.percentile(latencies, 50), np.percentile(latencies, 99)
+
+
+def main():
+    """
+    Compares the memory footprint, recall and latency of the compressed storage modes against the
+    flat index.
+
+    Usage (from the `src` directory):
+        python -m benchmarks.compressed_storage [--vectors N] [--dimension D] [--rerank-factor F]
+    """
+    parser = argparse.ArgumentParser(description="Benchmark compressed vector storage modes.")
+    parser.add_argument("--vectors", type=int, default=50000)
+    parser.add_argument("--dimension", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--rerank-factor", type=int, default=4)
+    parser.add_argument("--pq-subquantizers", type=int, default=64)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    vectors, queries = make_dataset(args.vectors, args.queries, args.dimension, rng)
+
+    print(f"{'mode':>6} {'index MB':>9} {'disk MB':>8} {'recall@k':>9} {'p50 ms':>7} {'p99 ms':>7}")
+    ground_truth = None
+    for storage_mode in STORAGE_MODES:
+        with tempfile.TemporaryDirectory() as path:
+            partition = build_partition(storage_mode, path, vectors, args.rerank_factor, args.pq_subquantizers)
+            if ground_truth is None:
+                # The flat index is exact, so its results are the ground truth of the other modes
+                ground_truth = [{doc.page_content for doc, _ in partition.search_by_vector(query.tolist(), k=args.k)} for query in queries]
+            recall, p50, p99 = evaluate(partition, queries, ground_truth, args.k)
+            stats = partition.stats()
+            print(f"{stats['storage_mode']:>6} {stats['index_memory_bytes'] / 2**20:>9.1f} {stats['full_vectors_disk_bytes'] / 2**20:>8.1f} "
+                  f"{recall:>9.3f} {p50:>7.2f} {p99:>7.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+import argparse
+import json
+
+import numpy as np
+from common.vector_db import FaissIndexer, distance_to_score
+
+# LLM calls skipped for every short-circuited query: the answer and the related queries
+CALLS_PER_QUERY = 2
+
+
+def load_questions(path: str) -> list:
+    """
+    Reads a labeled question set: one JSON object per line with a `question`, whether the index can
+    answer it (`answerable`) and optionally the `collections` and `filter` to search.
+    """
+    with open(path, encoding="utf-8") as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def top_scores(indexer: FaissIndexer, questions: list) -> np.ndarray:
+    """
+    Returns the score of the closest document of every question, -1 when nothing is retrieved.
+    """
+    scores = []
+    for question in questions:
+        results = indexer.search(question["question"], k=1, collections=question.get("collections"), metadata_filter=question.get("filter"))
+        scores.append(distance_to_score(results[0][1]) if results else -1.0)
+    return np.array(scores)
+
+
+def sweep(scores: np.ndarray, answerable: np.ndarray, thresholds) -> list:
+    """
+    Evaluates the confidence gate at every threshold.
+
+    Returns:
+        list: For every threshold, the share of queries short-circuited, the share of unanswerable
+              queries caught and the share of answerable queries wrongly short-circuited.
+    """
+    rows = []
+    for threshold in thresholds:
+        skipped = scores < threshold
+        rows.append({
+            "threshold": float(threshold),
+            "short_circuited": float(skipped.mean()),
+            "unanswerable_caught": float(skipped[~answerable].mean()) if (~answerable).any() else 0.0,
+            "answerable_skipped": float(skipped[answerable].mean()) if answerable.any() else 0.0
+        })
+    return rows
+
+
+def main():
+    """
+    Calibrates `CONFIDENCE_THRESHOLD` offline against a labeled question set: reports, for a range of
+    thresholds, how many queries would skip the LLM and how many answerable ones would be lost, and
+    recommends the highest threshold losing at most `--max-answerable-skipped` of the answerable ones.
+
+    Usage (from the `src` directory, with the index to calibrate against):
+        python -m benchmarks.confidence_calibration questions.jsonl [--index PATH] [--max-answerable-skipped 0.02]
+    """
+    parser = argparse.ArgumentParser(description="Calibrate the low-confidence short-circuit threshold.")
+    parser.add_argument("questions", help="JSONL file of {\"question\": ..., \"answerable\": true|false} objects.")
+    parser.add_argument("--index", default="faiss_index_file", help="Path of the Faiss index to calibrate against.")
+    parser.add_argument("--max-answerable-skipped", type=float, default=0.02)
+    parser.add_argument("--step", type=float, default=0.01)
+    args = parser.parse_args()
+
+    questions = load_questions(args.questions)
+    answerable = np.array([bool(question["answerable"]) for question in questions])
+    scores = top_scores(FaissIndexer(args.index), questions)
+    rows = sweep(scores, answerable, np.arange(args.step, 1 + args.step / 2, args.step))
+
+    print(f"{len(questions)} questions, {answerable.sum()} answerable")
+    for label, selected in (("answerable", answerable), ("unanswerable", ~answerable)):
+        if selected.any():
+            print(f"top score of {label} questions: p5 {np.percentile(scores[selected], 5):.3f}, "
+                  f"p50 {np.percentile(scores[selected], 50):.3f}, p95 {np.percentile(scores[selected], 95):.3f}")
+    print(f"{'threshold':>9} {'skipped':>8} {'calls saved':>12} {'unanswerable caught':>20} {'answerable lost':>16}")
+    for row in rows:
+        if 0 < row["short_circuited"] < 1:
+            print(f"{row['threshold']:>9.2f} {row['short_circuited']:>8.1%} {round(row['short_circuited'] * len(questions) * CALLS_PER_QUERY):>12} "
+                  f"{row['unanswerable_caught']:>20.1%} {row['answerable_skipped']:>16.1%}")
+
+    eligible = [row for row in rows if row["answerable_skipped"] <= args.max_answerable_skipped]
+    if not eligible:
+        print("No threshold keeps enough answerable questions, leave CONFIDENCE_THRESHOLD=0 (disabled)")
+        return
+    best = eligible[-1]
+    print(f"Recommended CONFIDENCE_THRESHOLD={best['threshold']:.2f}: skips {best['short_circuited']:.1%} of the queries, "
+          f"catches {best['unanswerable_caught']:.1%} of the unanswerable ones and loses {best['answerable_skipped']:.1%} of the answerable ones")
+
+
+if __name__ == "__main__":
+    main()
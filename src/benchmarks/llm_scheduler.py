@@ -0,0 +1,138 @@
+import argparse
+import sys
+import threading
+import time
+
+from langchain_core.messages import AIMessage
+from common.llm_scheduler import CallPriority, LLMScheduler
+
+
+class RateLimitError(Exception):
+    """
+    429 response of the fake chat model, recognized by the scheduler like the provider's.
+    """
+    status_code = 429
+
+
+class FakeChatModel:
+    """
+    Local stand-in for the chat model: answers every prompt after a fixed latency, records the order
+    prompts reach it in, and answers 429 when more than `capacity` calls are in flight. The `busy`
+    prompt holds its slot until `release` is set, so that every other call is queued behind it.
+    """
+
+    def __init__(self, latency: float = 0.05, capacity: int = None):
+        self.latency = latency
+        self.capacity = capacity
+        self.prompts = []
+        self.release = threading.Event()
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+    def invoke(self, prompt: str):
+        with self._lock:
+            if self.capacity is not None and self._in_flight >= self.capacity:
+                raise RateLimitError("Rate limit reached")
+            self._in_flight += 1
+            self.prompts.append(prompt)
+        try:
+            if prompt == "busy":
+                self.release.wait()
+            time.sleep(self.latency)
+            return AIMessage(content=f"answer to {prompt}")
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+
+def run_calls(scheduler: LLMScheduler, model: FakeChatModel, calls, stagger: float = 0.01) -> dict:
+    """
+    Sends (prompt, priority) calls from concurrent threads, in order, then releases the `busy` call and
+    returns the latency of every prompt.
+    """
+    latencies = {}
+
+    def call(prompt, priority):
+        start = time.perf_counter()
+        scheduler.invoke(prompt, priority=priority)
+        latencies[prompt] = time.perf_counter() - start
+
+    threads = []
+    for prompt, priority in calls:
+        thread = threading.Thread(target=call, args=(prompt, priority))
+        thread.start()
+        threads.append(thread)
+        time.sleep(stagger)
+    model.release.set()
+    for thread in threads:
+        thread.join()
+    return latencies
+
+
+def check_priority_ordering(latency: float) -> bool:
+    """
+    With a single slot busy, an answer queued after related-query calls must be sent before them.
+    """
+    model = FakeChatModel(latency)
+    scheduler = LLMScheduler(model, max_concurrency=1)
+    calls = [("busy", CallPriority.ANSWER)]
+    calls += [(f"related {number}", CallPriority.RELATED_QUERIES) for number in range(4)]
+    calls += [("reformulation", CallPriority.REFORMULATION), ("answer", CallPriority.ANSWER)]
+    run_calls(scheduler, model, calls)
+    print(f"priority ordering: upstream order {model.prompts}")
+    return model.prompts[1:3] == ["answer", "reformulation"]
+
+
+def check_coalescing(latency: float) -> bool:
+    """
+    An answer sending the same prompt as a queued prefetch must share its upstream call and move it up
+    to the answer priority, instead of waiting behind the related-query calls.
+    """
+    model = FakeChatModel(latency)
+    scheduler = LLMScheduler(model, max_concurrency=1)
+    calls = [("busy", CallPriority.ANSWER), ("shared", CallPriority.PREFETCH)]
+    calls += [(f"related {number}", CallPriority.RELATED_QUERIES) for number in range(4)]
+    calls += [("shared", CallPriority.ANSWER)]
+    latencies = run_calls(scheduler, model, calls)
+    stats = scheduler.get_stats()
+    print(f"coalescing: upstream order {model.prompts}, {stats['coalesced']} coalesced, shared call waited {latencies['shared']:.2f}s")
+    return model.prompts.count("shared") == 1 and model.prompts[1] == "shared" and stats["coalesced"] == 1
+
+
+def check_rate_limit_backoff(latency: float) -> bool:
+    """
+    A model only accepting two calls at a time must bring the concurrency limit down through 429
+    backoff, with every call eventually answered.
+    """
+    model = FakeChatModel(latency, capacity=2)
+    scheduler = LLMScheduler(model, max_concurrency=8, backoff_seconds=latency)
+    calls = [(f"question {number}", CallPriority.ANSWER) for number in range(16)]
+    latencies = run_calls(scheduler, model, calls, stagger=0)
+    stats = scheduler.get_stats()
+    print(f"429 backoff: {stats['calls']} calls answered, {stats['rate_limited']} rate limited, "
+          f"{stats['failed']} failed, concurrency limit {stats['concurrency_limit']}, slowest call {max(latencies.values()):.2f}s")
+    return stats["calls"] == len(calls) and stats["failed"] == 0 and stats["rate_limited"] > 0 and stats["concurrency_limit"] < 8
+
+
+def main():
+    """
+    Checks the LLM call scheduler against a local fake chat model: answers go first, identical prompts
+    share one upstream call at the priority of their most urgent request, and 429 responses lower the
+    concurrency without failing calls. Exits with an error if any check fails.
+
+    Usage (from the `src` directory):
+        python -m benchmarks.llm_scheduler [--latency SECONDS]
+    """
+    parser = argparse.ArgumentParser(description="Check the LLM call scheduler against a fake chat model.")
+    parser.add_argument("--latency", type=float, default=0.05, help="Latency of every fake model call, in seconds.")
+    args = parser.parse_args()
+
+    failed = [check.__name__ for check in (check_priority_ordering, check_coalescing, check_rate_limit_backoff) if not check(args.latency)]
+    if failed:
+        print(f"Failed checks: {', '.join(failed)}")
+        sys.exit(1)
+    print("All scheduler checks passed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+import argparse
+import time
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import FakeEmbeddings
+from common.vector_db import IndexPartition
+
+
+def build_partitions(num_partitions: int, vectors_per_partition: int, dimension: int, rng):
+    """
+    Builds in-memory partitions filled with random normalized vectors.
+    """
+    partitions = []
+    for partition_number in range(num_partitions):
+        name = f"collection_{partition_number}"
+        partition = IndexPartition(name, None, FakeEmbeddings(size=dimension), dimension=dimension)
+        vectors = rng.standard_normal((vectors_per_partition, dimension)).astype("float32")
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        documents = [Document(page_content=f"{name} document {i}", metadata={"source": f"{name}/{i}"}) for i in range(vectors_per_partition)]
+        partition.add(documents, vectors.tolist())
+        partitions.append(partition)
+    return partitions
+
+
+def search(partitions, vector, k: int):
+    """
+    Searches the given partitions and merges their results, like FaissIndexer.search does.
+    """
+    results = []
+    for partition in partitions:
+        results.extend(partition.search_by_vector(vector, k=k))
+    results.sort(key=lambda result: result[1])
+    return results[:k]
+
+
+def measure(partitions, queries, k: int):
+    """
+    Returns the p50 and p99 search latency in milliseconds.
+    """
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        search(partitions, query, k)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return np.percentile(latencies, 50), np.percentile(latencies, 99)
+
+
+def main():
+    """
+    Benchmarks the query latency of a search restricted to one collection against a search over all
+    collections, as the number of collections grows.
+
+    Usage (from the `src` directory):
+        python -m benchmarks.partition_search [--partitions 1 2 4 8 16] [--vectors-per-partition N] [--dimension D]
+    """
+    parser = argparse.ArgumentParser(description="Benchmark partitioned search latency.")
+    parser.add_argument("--partitions", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--vectors-per-partition", type=int, default=5000)
+    parser.add_argument("--dimension", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=4)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    queries = rng.standard_normal((args.queries, args.dimension)).astype("float32")
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    queries = queries.tolist()
+
+    print(f"{'partitions':>10} {'vectors':>10} {'one p50 ms':>11} {'one p99 ms':>11} {'all p50 ms':>11} {'all p99 ms':>11}")
+    for num_partitions in args.partitions:
+        partitions = build_partitions(num_partitions, args.vectors_per_partition, args.dimension, rng)
+        one_p50, one_p99 = measure(partitions[:1], queries, args.k)
+        all_p50, all_p99 = measure(partitions, queries, args.k)
+        print(f"{num_partitions:>10} {num_partitions * args.vectors_per_partition:>10} {one_p50:>11.2f} {one_p99:>11.2f} {all_p50:>11.2f} {all_p99:>11.2f}")
+
+
+if __name__ == "__main__":
+    main()
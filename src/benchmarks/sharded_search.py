@@ -0,0 +1,82 @@
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import faiss
+import numpy as np
+from common.sharded_index import ShardedIndex
+
+
+def random_vectors(count: int, dimension: int, rng) -> np.ndarray:
+    """
+    Returns random normalized vectors.
+    """
+    vectors = rng.standard_normal((count, dimension)).astype("float32")
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+
+def measure(index, queries: np.ndarray, k: int, clients: int):
+    """
+    Runs every query once from `clients` concurrent threads and returns the throughput in queries per
+    second along with the p50 and p99 latency in milliseconds.
+    """
+    def timed_search(query):
+        start = time.perf_counter()
+        index.search(query[None, :], k)
+        return (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as executor:
+        latencies = list(executor.map(timed_search, queries))
+    elapsed = time.perf_counter() - start
+    return len(queries) / elapsed, np.percentile(latencies, 50), np.percentile(latencies, 99)
+
+
+def main():
+    """
+    Benchmarks the search throughput of a sharded index against the number of shards on one machine,
+    with a single-process flat index as the baseline, and reports the share of vectors moved when a
+    shard is added.
+
+    Usage (from the `src` directory):
+        python -m benchmarks.sharded_search [--shards 1 2 4 8] [--vectors N] [--dimension D] [--clients C]
+    """
+    parser = argparse.ArgumentParser(description="Benchmark sharded scatter-gather search throughput.")
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--vectors", type=int, default=200000)
+    parser.add_argument("--dimension", type=int, default=1536)
+    parser.add_argument("--sources", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--k", type=int, default=4)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    vectors = random_vectors(args.vectors, args.dimension, rng)
+    queries = random_vectors(args.queries, args.dimension, rng)
+    ids = np.arange(args.vectors)
+    keys = [f"https://handbook.gitlab.com/page-{i % args.sources}" for i in range(args.vectors)]
+
+    flat_index = faiss.IndexFlatL2(args.dimension)
+    flat_index.add(vectors)
+    _, expected_ids = flat_index.search(queries, args.k)
+    qps, p50, p99 = measure(flat_index, queries, args.k, args.clients)
+
+    print(f"{'shards':>8} {'qps':>9} {'p50 ms':>8} {'p99 ms':>8} {'recall':>7} {'moved on +1 shard':>18}")
+    print(f"{'none':>8} {qps:>9.1f} {p50:>8.2f} {p99:>8.2f} {1.0:>7.3f} {'-':>18}")
+    for shards in args.shards:
+        index = ShardedIndex(args.dimension, shards)
+        try:
+            index.add(ids, vectors, keys)
+            _, found_ids = index.search(queries, args.k)
+            recall = np.mean([len(set(found) & set(expected)) / args.k for found, expected in zip(found_ids, expected_ids)])
+            qps, p50, p99 = measure(index, queries, args.k, args.clients)
+            moved = index.resize(shards + 1) / args.vectors
+            print(f"{shards:>8} {qps:>9.1f} {p50:>8.2f} {p99:>8.2f} {recall:>7.3f} {moved:>17.1%}")
+        finally:
+            index.close()
+
+
+if __name__ == "__main__":
+    main()
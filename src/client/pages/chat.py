@@ -24,15 +24,18 @@ def chat_bot():
             st.markdown(message["content"])
     if st.session_state.rel_queries:
         st.markdown("also search?")
-    for query in st.session_state.rel_queries:
-        st.button(query)
+    # A clicked related query is sent like a typed one, so its prefetched answer can be used
+    clicked_query = None
+    for i, query in enumerate(st.session_state.rel_queries):
+        if st.button(query, key=f"rel_query_{i}"):
+            clicked_query = query
     if st.session_state.refs:
         st.markdown("References:")
     for ref in st.session_state.refs:
         st.markdown(ref)
     
     # Chat input
-    if prompt := st.chat_input("What is up?"):
+    if prompt := st.chat_input("What is up?") or clicked_query:
         st.session_state.messages.append({"role": "user", "content": prompt})
         with st.chat_message("user"):
             st.markdown(prompt)
@@ -57,13 +60,9 @@ def chat_bot():
                 text = f"Error: {e}"
 
             st.markdown(text)
-            st.markdown("also search?")
-            for query in st.session_state.rel_queries:
-                st.button(query)
-            st.markdown("References:")
-            for ref in st.session_state.refs:
-                st.markdown(ref)
             st.session_state.messages.append({"role": "assistant", "content": text})
+        # Rerun to render the new related queries and references as clickable buttons
+        st.rerun()
 chat_bot()
 
 
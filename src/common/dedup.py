@@ -0,0 +1,130 @@
+import re
+import threading
+import zlib
+from typing import Dict, Hashable, Optional, Tuple
+import numpy as np
+
+# Number of MinHash permutations, split into LSH bands of a few rows each. With 32 bands of 4 rows a
+# pair of documents becomes a candidate with a probability of 87% at a Jaccard similarity of 0.5 and
+# over 99.9% from 0.8, so thresholds from about 0.6 upwards are detected reliably
+NUM_PERMUTATIONS = 128
+LSH_BANDS = 32
+LSH_ROWS = NUM_PERMUTATIONS // LSH_BANDS
+
+# Number of consecutive words per shingle
+SHINGLE_SIZE = 5
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_WORD_PATTERN = re.compile(r"\w+")
+
+
+def shingles(text: str, size: int = SHINGLE_SIZE) -> set:
+    """
+    Returns the set of word shingles of a text, ignoring case, punctuation and whitespace.
+
+    Args:
+        text (str): The text.
+        size (int): Number of consecutive words per shingle.
+
+    Returns:
+        set: The shingles; a text shorter than one shingle is a single shingle.
+    """
+    words = _WORD_PATTERN.findall(text.lower())
+    if len(words) <= size:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+class NearDuplicateIndex:
+    """
+    MinHash/LSH index of the documents of a partition, used to spot near-duplicates before embedding.
+
+    The MinHash signature of a document estimates the Jaccard similarity of its word shingles with any
+    other document. Signatures are split into bands and a document only gets compared with the ones
+    sharing at least one band, so looking up a document stays cheap however many are indexed.
+    """
+
+    def __init__(self, seed: int = 1):
+        """
+        Initializes the NearDuplicateIndex class.
+
+        Args:
+            seed (int): Seed of the hash permutations; signatures are only comparable with the same seed.
+        """
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, 1 << 32, size=NUM_PERMUTATIONS, dtype=np.uint64)
+        self._b = rng.integers(0, 1 << 32, size=NUM_PERMUTATIONS, dtype=np.uint64)
+        self._lock = threading.Lock()
+        self._signatures: Dict[Hashable, np.ndarray] = {}
+        self._bands = [dict() for _ in range(LSH_BANDS)]  # Maps the rows of a band to the keys sharing them
+
+    def signature(self, text: str) -> Optional[np.ndarray]:
+        """
+        Computes the MinHash signature of a text.
+
+        Returns:
+            np.ndarray: The signature, or None for a text without words.
+        """
+        text_shingles = shingles(text)
+        if not text_shingles:
+            return None
+        hashes = np.fromiter((zlib.crc32(shingle.encode()) for shingle in text_shingles), dtype=np.uint64, count=len(text_shingles))
+        # Both factors are below 2**32, so the universal hashes cannot overflow 64 bits
+        permuted = (np.outer(self._a, hashes) + self._b[:, None]) % _MERSENNE_PRIME
+        return permuted.min(axis=1)
+
+    def _band_keys(self, signature: np.ndarray):
+        """
+        Returns the bucket key of every band of a signature.
+        """
+        return [signature[band * LSH_ROWS:(band + 1) * LSH_ROWS].tobytes() for band in range(LSH_BANDS)]
+
+    def add(self, key: Hashable, signature: np.ndarray):
+        """
+        Indexes the signature of a document.
+        """
+        with self._lock:
+            self._signatures[key] = signature
+            for band, band_key in enumerate(self._band_keys(signature)):
+                self._bands[band].setdefault(band_key, set()).add(key)
+
+    def remove(self, key: Hashable):
+        """
+        Removes a document from the index; unknown keys are ignored.
+        """
+        with self._lock:
+            signature = self._signatures.pop(key, None)
+            if signature is None:
+                return
+            for band, band_key in enumerate(self._band_keys(signature)):
+                bucket = self._bands[band].get(band_key)
+                if bucket is not None:
+                    bucket.discard(key)
+                    if not bucket:
+                        del self._bands[band][band_key]
+
+    def find(self, signature: np.ndarray, threshold: float, exclude=()) -> Optional[Tuple[Hashable, float]]:
+        """
+        Finds the indexed document most similar to a signature, if it is similar enough.
+
+        Args:
+            signature (np.ndarray): The signature of the document to look up.
+            threshold (float): Minimum estimated Jaccard similarity of a near-duplicate.
+            exclude (optional): Keys of documents that must not be matched.
+
+        Returns:
+            tuple: The key of the most similar document and its estimated similarity, or None.
+        """
+        with self._lock:
+            candidates = set()
+            for band, band_key in enumerate(self._band_keys(signature)):
+                candidates.update(self._bands[band].get(band_key, ()))
+            best = None
+            for key in candidates.difference(exclude):
+                similarity = float(np.mean(self._signatures[key] == signature))
+                if similarity >= threshold and (best is None or similarity > best[1]):
+                    best = (key, similarity)
+            return best
+
+    def __len__(self) -> int:
+        return len(self._signatures)
@@ -0,0 +1,160 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+from langchain_core.embeddings import Embeddings
+from common.logger import logger
+
+
+class _EmbeddingRequest:
+    """
+    A query waiting for its embedding.
+    """
+
+    def __init__(self, text: str):
+        self.text = text
+        self.enqueued_at = time.monotonic()
+        self.done = threading.Event()
+        self.vector = None
+        self.error = None
+
+
+class EmbeddingBatcher(Embeddings):
+    """
+    Micro-batcher in front of an embedding provider.
+
+    Query embeddings requested by concurrent requests are collected for up to `max_wait_ms` milliseconds,
+    or until `max_batch_size` of them are waiting, and sent upstream as a single `embed_documents` call
+    whose results are fanned back out to the callers. Identical queries of a batch are only embedded once.
+    Up to `max_concurrent_batches` batches are in flight at a time, so a slow upstream call does not hold
+    back the collection of the next batch.
+    Document embeddings are already batched by the ingestion path and are passed through as-is.
+    """
+
+    def __init__(self, embeddings: Embeddings, max_wait_ms: float = None, max_batch_size: int = None,
+                 max_concurrent_batches: int = None):
+        """
+        Initializes the EmbeddingBatcher class.
+
+        Args:
+            embeddings (Embeddings): The embedding provider.
+            max_wait_ms (float, optional): Longest time a query waits for others. Defaults to `EMBEDDING_BATCH_WAIT_MS` or 5.
+            max_batch_size (int, optional): Largest number of queries per upstream call. Defaults to `EMBEDDING_BATCH_SIZE` or 64.
+            max_concurrent_batches (int, optional): Upstream calls in flight at a time. Defaults to `EMBEDDING_BATCH_CONCURRENCY` or 4.
+        """
+        self.embeddings = embeddings
+        self.max_wait_ms = max_wait_ms if max_wait_ms is not None else float(os.getenv("EMBEDDING_BATCH_WAIT_MS", 5))
+        self.max_batch_size = max_batch_size or int(os.getenv("EMBEDDING_BATCH_SIZE", 64))
+        self.max_concurrent_batches = max_concurrent_batches or int(os.getenv("EMBEDDING_BATCH_CONCURRENCY", 4))
+        self._requests = queue.Queue()
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrent_batches, thread_name_prefix="embedding-batch")
+        self._worker = None
+        self._lock = threading.Lock()
+        self._stats = {
+            "requests": 0,
+            "upstream_calls": 0,
+            "largest_batch": 0,
+            "added_wait_seconds": 0.0
+        }
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embeds documents directly with the embedding provider.
+        """
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        """
+        Embeds a query as part of the next batch sent upstream.
+
+        Args:
+            text (str): The query to embed.
+
+        Returns:
+            list: The embedding of the query.
+
+        Raises:
+            Exception: The error of the upstream call the query was part of.
+        """
+        self._ensure_worker()
+        request = _EmbeddingRequest(text)
+        self._requests.put(request)
+        request.done.wait()
+        if request.error:
+            raise request.error
+        return request.vector
+
+    def _ensure_worker(self):
+        """
+        Starts the batching thread on the first query.
+        """
+        if self._worker and self._worker.is_alive():
+            return
+        with self._lock:
+            if not (self._worker and self._worker.is_alive()):
+                self._worker = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        """
+        Batching loop: waits for a query, collects the ones arriving within the wait window and hands
+        them over to be embedded together.
+        """
+        while True:
+            batch = [self._requests.get()]
+            deadline = batch[0].enqueued_at + self.max_wait_ms / 1000
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._requests.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._executor.submit(self._embed_batch, batch, time.monotonic())
+
+    def _embed_batch(self, batch: List[_EmbeddingRequest], dispatched_at: float):
+        """
+        Embeds the distinct texts of a batch in one upstream call and hands every caller its vector.
+        """
+        texts = list(dict.fromkeys(request.text for request in batch))
+        try:
+            vectors = dict(zip(texts, self.embeddings.embed_documents(texts)))
+            for request in batch:
+                request.vector = vectors[request.text]
+        except Exception as e:
+            logger.error(f"Error embedding a batch of {len(texts)} queries: {str(e)}")
+            for request in batch:
+                request.error = e
+        finally:
+            with self._lock:
+                self._stats["requests"] += len(batch)
+                self._stats["upstream_calls"] += 1
+                self._stats["largest_batch"] = max(self._stats["largest_batch"], len(batch))
+                self._stats["added_wait_seconds"] += sum(dispatched_at - request.enqueued_at for request in batch)
+            for request in batch:
+                request.done.set()
+
+    def get_stats(self) -> dict:
+        """
+        Reports how much batching the query embeddings get.
+
+        Returns:
+            dict: The number of queries and of upstream calls (one per batch), the number of upstream calls
+                  saved, the average and largest batch sizes and the average wait added to a query.
+        """
+        with self._lock:
+            requests = self._stats["requests"]
+            upstream_calls = self._stats["upstream_calls"]
+            return {
+                "requests": requests,
+                "upstream_calls": upstream_calls,
+                "upstream_calls_saved": requests - upstream_calls,
+                "average_batch_size": requests / upstream_calls if upstream_calls else 0.0,
+                "largest_batch": self._stats["largest_batch"],
+                "average_added_wait_ms": 1000 * self._stats["added_wait_seconds"] / requests if requests else 0.0,
+                "max_wait_ms": self.max_wait_ms,
+                "max_batch_size": self.max_batch_size
+            }
@@ -1,9 +1,12 @@
+import os
+import threading
 from langchain.chains import RetrievalQA
 from langchain.prompts import PromptTemplate
 from langchain.chat_models import ChatOpenAI
-from common.vector_db import FaissIndexer
+from common.vector_db import FaissIndexer, distance_to_score
 from fastapi import HTTPException
-from common.prompt import QueryPrompt  # Import the Enum for prompt template
+from common.prompt import QueryPrompt, FALLBACK_ANSWER  # Import the Enum for prompt template
+from common.llm_scheduler import LLMScheduler, CallPriority
 from common.logger import logger
 from pydantic import BaseModel
 
@@ -14,76 +17,183 @@ class InstructAIQueryService:
 
     Methods:
         query(query: str): Processes the user's query, retrieves relevant documents, and invokes GPT-4 to generate an answer.
-        get_modified_userquery(query: str, history: str): Reformats the user's query based on chat history and invokes GPT-4 for a modified response.
+        get_modified_userquery(query: str, history: str, summary: str): Reformats the user's query based on chat history and invokes GPT-4 for a modified response.
+        summarize_history(summary: str, turns: list, max_words: int): Folds conversation turns into a rolling summary.
         get_related_queries(query: str, answer: str): Generates a set of related queries based on the user's question and answer.
+        get_confidence_stats(): Reports how many answer calls the confidence gate saved.
     """
 
-    def __init__(self):
+    def __init__(self, llm=None):
         """
         Initializes the InstructAIQueryService with a FAISS indexer and a GPT-4 model for question answering.
+
+        Args:
+            llm (optional): Chat model to use instead of GPT-4, e.g. a local fake model in tests.
         """
         # Load the FAISS indexer instance to interact with the vector database
         self.vector_db = FaissIndexer()
 
-        # Initialize the GPT model for question answering
-        self.llm = ChatOpenAI(model="gpt-4o")
+        # Initialize the GPT model for question answering. Retries are left to the scheduler, which needs
+        # to see the 429 responses to adapt its concurrency and retries transient errors itself.
+        self.llm = llm or ChatOpenAI(model="gpt-4o", max_retries=0)
+
+        # Every call to the model goes through the shared scheduler
+        self.scheduler = LLMScheduler(self.llm)
+
+        # Queries whose closest document scores below the threshold get the fallback answer without any
+        # LLM call. 0 disables the gate; calibrate it with `python -m benchmarks.confidence_calibration`.
+        self.confidence_threshold = float(os.getenv("CONFIDENCE_THRESHOLD", 0))
+        self._confidence_lock = threading.Lock()
+        # User-facing queries and speculative prefetches are counted apart, so prefetching does not skew the rates
+        self._confidence_stats = {"queries": 0, "short_circuited": 0, "prefetch_queries": 0, "prefetch_short_circuited": 0}
+
+
+    def retrieve(self, query: str, collections=None, metadata_filter=None):
+        """
+        Retrieves the documents relevant to a query along with their distance to it, without any LLM call.
+
+        Args:
+            query (str): The query/question provided by the user.
+            collections (list, optional): Collections to search. All collections are searched when not given.
+            metadata_filter (dict, optional): Metadata the retrieved documents must match.
+
+        Returns:
+            list: (document, distance) pairs, closest first.
+        """
+        return self.vector_db.search(query, collections=collections, metadata_filter=metadata_filter)
 
 
-    def query(self, query: str):
+    def query(self, query: str, collections=None, metadata_filter=None, priority: CallPriority = CallPriority.ANSWER, results=None):
         """
         Processes the user's query by retrieving relevant documents from the vector database
         and using GPT-4 to generate an answer.
 
+        When the closest document scores below `confidence_threshold`, the context cannot answer the
+        query and the fallback answer is returned along with the closest sources, without calling GPT-4.
+
         Args:
             query (str): The query/question provided by the user.
+            collections (list, optional): Collections to search. All collections are searched when not given.
+            metadata_filter (dict, optional): Metadata the retrieved documents must match.
+            priority (CallPriority): Scheduling priority of the answer call; speculative prefetching lowers it.
+            results (list, optional): Documents already retrieved for the query, e.g. by speculative prefetching.
 
         Returns:
-            dict: A dictionary containing the generated answer and the source documents used.
+            dict: A dictionary containing the generated answer, the source documents used, the score of the
+                  closest document and whether the answer was short-circuited by the confidence gate.
 
         Raises:
             HTTPException: If an error occurs while processing the query.
         """
         try:
             print(query)
-            # Use the retriever to get relevant documents
-            retrieved_docs = self.vector_db.as_retriever().get_relevant_documents(query)
-            formatted_prompt = QueryPrompt.QUERY_PROMPT.value.format(question=query, context=retrieved_docs)
+            # Retrieve the relevant documents along with their distance to the query
+            if results is None:
+                results = self.retrieve(query, collections=collections, metadata_filter=metadata_filter)
+            retrieved_docs = [doc for doc, _ in results]
+            top_score = distance_to_score(results[0][1]) if results else None
             _src_docs = []
             for i, doc in enumerate(retrieved_docs, start=1):
                 _src_docs.append(doc.metadata.get("source"))
 
+            low_confidence = self.is_low_confidence(top_score)
+            prefix = "prefetch_" if priority == CallPriority.PREFETCH else ""
+            with self._confidence_lock:
+                self._confidence_stats[f"{prefix}queries"] += 1
+                self._confidence_stats[f"{prefix}short_circuited"] += low_confidence
+            if low_confidence:
+                logger.info(f"Top score {top_score} below the confidence threshold {self.confidence_threshold}, skipping the answer call")
+                return {
+                    "answer": FALLBACK_ANSWER,
+                    "source_documents": _src_docs,
+                    "top_score": top_score,
+                    "low_confidence": True
+                }
+
+            formatted_prompt = QueryPrompt.QUERY_PROMPT.value.format(question=query, context=retrieved_docs)
+
             # Execute the query through the RetrievalQA chain
-            response = self.llm.invoke(formatted_prompt)
+            response = self.scheduler.invoke(formatted_prompt, priority=priority)
             print(response)
 
             return {
                 "answer": response.content,
-                "source_documents": _src_docs
+                "source_documents": _src_docs,
+                "top_score": top_score,
+                "low_confidence": False
             }
 
         except Exception as e:
             logger.error(f"Error processing query: {str(e)}")
             raise HTTPException(status_code=500, detail=f"Error processing query: {str(e)}")
 
-    def get_modified_userquery(self, query, history):
+    def is_low_confidence(self, top_score) -> bool:
+        """
+        Tells whether the score of the closest document is too low for the context to answer the query.
+
+        Args:
+            top_score (float): Score of the closest document, or None when nothing was retrieved.
+
+        Returns:
+            bool: True if the gate is enabled and the query should get the fallback answer.
+        """
+        if self.confidence_threshold <= 0:
+            return False
+        return top_score is None or top_score < self.confidence_threshold
+
+    def get_confidence_stats(self) -> dict:
+        """
+        Reports the threshold of the confidence gate and the number of answer calls it saved.
+
+        Returns:
+            dict: The threshold, the user-facing queries answered, those short-circuited and their share, and
+                  the same counts for the speculatively prefetched queries.
+        """
+        with self._confidence_lock:
+            stats = dict(self._confidence_stats)
+        stats["threshold"] = self.confidence_threshold
+        stats["short_circuit_rate"] = stats["short_circuited"] / stats["queries"] if stats["queries"] else 0.0
+        return stats
+
+    def get_modified_userquery(self, query, history, summary=None):
         """
         Reformats the user's query based on chat history and generates a modified response using GPT-4.
 
         Args:
             query (str): The query/question to be modified.
             history (str): The chat history to provide context for the modification.
+            summary (str, optional): Summary of the conversation preceding the chat history.
 
         Returns:
             str: The modified query after processing.
         """
         try:
-            formatted_prompt = QueryPrompt.REFORMATTING_QUERY.value.format(question=query, chat_history=history)
-            response = self.llm.invoke(formatted_prompt)
+            formatted_prompt = QueryPrompt.REFORMATTING_QUERY.value.format(question=query, history_summary=summary or "None", chat_history=history)
+            response = self.scheduler.invoke(formatted_prompt, priority=CallPriority.REFORMULATION)
             return response.content
         except Exception as e:
             logger.error(f"Error processing modify query: {str(e)}")
             return query
 
+    def summarize_history(self, summary, turns, max_words: int):
+        """
+        Folds conversation turns into the rolling summary of the earlier conversation.
+
+        Args:
+            summary (str): The current summary, empty if there is none yet.
+            turns (list): The turns to fold into the summary.
+            max_words (int): Length limit of the summary.
+
+        Returns:
+            str: The updated summary.
+
+        Raises:
+            Exception: If the summary could not be generated; the caller keeps the current one.
+        """
+        formatted_prompt = QueryPrompt.HISTORY_SUMMARY.value.format(summary=summary or "None", turns=turns, max_words=max_words)
+        response = self.scheduler.invoke(formatted_prompt, priority=CallPriority.SUMMARY)
+        return response.content.strip()
+
     def get_related_queries(self, query, answer):
         """
         Generates a set of related queries based on the user's question and the answer provided.
@@ -97,7 +207,7 @@ class InstructAIQueryService:
         """
         try:
             formatted_prompt = QueryPrompt.RELATED_QUERIES.value.format(question=query, answer=answer)
-            response = self.llm.invoke(formatted_prompt)
+            response = self.scheduler.invoke(formatted_prompt, priority=CallPriority.RELATED_QUERIES)
             return response.content
         except Exception as e:
             logger.error(f"Error processing related queries: {str(e)}")
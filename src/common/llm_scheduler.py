@@ -0,0 +1,322 @@
+import heapq
+import itertools
+import os
+import threading
+import time
+from collections import deque
+from enum import IntEnum
+from common.logger import logger
+from common.tokens import count_tokens
+
+
+class CallPriority(IntEnum):
+    """
+    Priority of an LLM call; lower values are scheduled first.
+    """
+    ANSWER = 0
+    REFORMULATION = 1
+    RELATED_QUERIES = 2
+    PREFETCH = 3
+    SUMMARY = 4
+
+
+class _PendingCall:
+    """
+    An upstream call shared by every request that sent the same prompt while it was in flight.
+    """
+
+    def __init__(self, priority: CallPriority):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.priority = priority  # Highest priority among the requests sharing the call
+        self.ticket = None  # Ticket of the call in the queue while it waits for a slot
+
+
+class LLMScheduler:
+    """
+    Shared scheduler in front of the chat model.
+
+    - Calls wait in a priority queue, so answer generation goes before query reformulation, which goes
+      before related-query generation; speculative prefetching and history summaries only get what is left.
+    - Concurrency adapts to the provider's rate limits: every 429 response halves the number of calls
+      allowed in flight and pauses admissions for a backoff period, every success raises it again by a
+      fraction of a call (additive increase, multiplicative decrease).
+    - An optional tokens-per-minute budget holds calls back until the estimated tokens of the last
+      minute leave room for them.
+    - Identical prompts sent while a call for them is in flight are coalesced into that single call.
+      A call still queued is moved up to the priority of the most urgent request joining it.
+    - Transient errors (timeouts, connection errors and 5xx responses) are retried with exponential
+      backoff, since the chat model is created without retries of its own so that 429s reach the scheduler.
+
+    Any object with an `invoke(prompt)` method can be scheduled, which makes it easy to exercise the
+    scheduler against a local fake model.
+    """
+
+    def __init__(self, llm, max_concurrency: int = None, tokens_per_minute: int = None,
+                 max_retries: int = 5, backoff_seconds: float = 1.0, expected_output_tokens: int = 512,
+                 transient_retries: int = 2):
+        """
+        Initializes the LLMScheduler class.
+
+        Args:
+            llm: The chat model, or any object with an `invoke(prompt)` method.
+            max_concurrency (int, optional): Upper bound of calls in flight. Defaults to `LLM_MAX_CONCURRENCY` or 8.
+            tokens_per_minute (int, optional): Token budget per minute, 0 for none. Defaults to `LLM_TOKENS_PER_MINUTE` or 0.
+            max_retries (int): Number of retries of a rate-limited call before its error is raised.
+            backoff_seconds (float): Initial pause after a rate-limited call, doubled on every retry.
+            expected_output_tokens (int): Completion tokens assumed for every call in the token budget.
+            transient_retries (int): Number of retries of a call failing with a transient error, like the SDK default.
+        """
+        self.llm = llm
+        self.max_concurrency = max_concurrency or int(os.getenv("LLM_MAX_CONCURRENCY", 8))
+        self.tokens_per_minute = tokens_per_minute if tokens_per_minute is not None else int(os.getenv("LLM_TOKENS_PER_MINUTE", 0))
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.expected_output_tokens = expected_output_tokens
+        self.transient_retries = transient_retries
+
+        self._condition = threading.Condition()
+        self._queue = []  # Heap of (priority, sequence) tickets waiting for a slot
+        self._sequence = itertools.count()
+        self._concurrency_limit = float(self.max_concurrency)
+        self._in_flight = 0
+        self._paused_until = 0.0
+        self._token_window = deque()  # (timestamp, tokens) of the calls admitted during the last minute
+        self._pending = {}  # Maps in-flight prompts to their shared call
+
+        self._stats = {
+            "calls": 0,
+            "coalesced": 0,
+            "rate_limited": 0,
+            "transient_errors": 0,
+            "failed": 0,
+            "queue_wait_seconds": {priority.name: 0.0 for priority in CallPriority},
+            "calls_by_priority": {priority.name: 0 for priority in CallPriority},
+            "prompt_tokens": {priority.name: 0 for priority in CallPriority},
+            "max_prompt_tokens": {priority.name: 0 for priority in CallPriority}
+        }
+
+    def invoke(self, prompt: str, priority: CallPriority = CallPriority.ANSWER):
+        """
+        Sends a prompt to the chat model once it is its turn, or joins an identical call in flight.
+
+        Args:
+            prompt (str): The prompt to send.
+            priority (CallPriority): Priority of the call.
+
+        Returns:
+            The response of the chat model.
+
+        Raises:
+            Exception: The error of the upstream call once the retries are exhausted.
+        """
+        with self._condition:
+            pending = self._pending.get(prompt)
+            leader = pending is None
+            if leader:
+                pending = _PendingCall(priority)
+                self._pending[prompt] = pending
+            else:
+                self._stats["coalesced"] += 1
+                if priority < pending.priority:
+                    self._raise_priority(pending, priority)
+
+        if not leader:
+            pending.done.wait()
+            if pending.error:
+                raise pending.error
+            return pending.result
+
+        try:
+            pending.result = self._call(prompt, pending)
+        except Exception as e:
+            pending.error = e
+            raise
+        finally:
+            with self._condition:
+                del self._pending[prompt]
+            pending.done.set()
+        return pending.result
+
+    def _raise_priority(self, pending: _PendingCall, priority: CallPriority):
+        """
+        Raises the priority of a shared call joined by a more urgent request, moving its ticket up the
+        queue if it is still waiting for a slot. Must be called with the condition held.
+        """
+        pending.priority = priority
+        if pending.ticket is not None:
+            self._queue.remove(pending.ticket)
+            pending.ticket = (int(priority), pending.ticket[1])
+            self._queue.append(pending.ticket)
+            heapq.heapify(self._queue)
+            self._condition.notify_all()
+
+    def _call(self, prompt: str, pending: _PendingCall):
+        """
+        Runs a call, retrying it with exponential backoff as long as it is rate limited, and a few
+        times when it fails with a transient error.
+        """
+        prompt_tokens = count_tokens(prompt)
+        tokens = prompt_tokens + self.expected_output_tokens
+        rate_limited_attempts = transient_attempts = 0
+        while True:
+            self._acquire(pending, tokens)
+            try:
+                response = self.llm.invoke(prompt)
+            except Exception as e:
+                self._release()
+                if self._is_rate_limit_error(e) and rate_limited_attempts < self.max_retries:
+                    self._on_rate_limited(rate_limited_attempts)
+                    rate_limited_attempts += 1
+                    continue
+                if self._is_transient_error(e) and transient_attempts < self.transient_retries:
+                    self._on_transient_error(e, transient_attempts)
+                    transient_attempts += 1
+                    continue
+                with self._condition:
+                    self._stats["failed"] += 1
+                raise
+            self._release(success=True)
+            with self._condition:
+                priority = pending.priority
+                self._stats["calls"] += 1
+                self._stats["calls_by_priority"][priority.name] += 1
+                self._stats["prompt_tokens"][priority.name] += prompt_tokens
+                self._stats["max_prompt_tokens"][priority.name] = max(self._stats["max_prompt_tokens"][priority.name], prompt_tokens)
+            return response
+
+    def _acquire(self, pending: _PendingCall, tokens: int):
+        """
+        Blocks until the call is the highest-priority one waiting and a slot and token budget are free.
+        """
+        queued_at = time.monotonic()
+        with self._condition:
+            pending.ticket = (int(pending.priority), next(self._sequence))
+            heapq.heappush(self._queue, pending.ticket)
+            while True:
+                # The ticket is replaced when a more urgent request joins the call
+                timeout = self._admission_delay(pending.ticket, tokens)
+                if timeout == 0:
+                    break
+                self._condition.wait(timeout)
+
+            heapq.heappop(self._queue)
+            pending.ticket = None
+            priority = pending.priority
+            self._in_flight += 1
+            now = time.monotonic()
+            if self.tokens_per_minute:
+                self._token_window.append((now, tokens))
+            self._stats["queue_wait_seconds"][priority.name] += now - queued_at
+            # The next call in line may be admitted as well
+            self._condition.notify_all()
+
+    def _admission_delay(self, ticket, tokens: int):
+        """
+        Returns 0 if the call can be admitted now, otherwise how long to wait before checking again
+        (None to wait for a notification). Must be called with the condition held.
+        """
+        if self._queue[0] != ticket or self._in_flight >= int(self._concurrency_limit):
+            return None
+        now = time.monotonic()
+        if now < self._paused_until:
+            return self._paused_until - now
+        if self.tokens_per_minute:
+            while self._token_window and self._token_window[0][0] <= now - 60:
+                self._token_window.popleft()
+            used = sum(window_tokens for _, window_tokens in self._token_window)
+            if self._token_window and used + tokens > self.tokens_per_minute:
+                return self._token_window[0][0] + 60 - now
+        return 0
+
+    def _release(self, success: bool = False):
+        """
+        Frees the slot of a finished call and raises the concurrency limit after a success.
+        """
+        with self._condition:
+            self._in_flight -= 1
+            if success:
+                self._concurrency_limit = min(self.max_concurrency, self._concurrency_limit + 1 / self._concurrency_limit)
+            self._condition.notify_all()
+
+    def _on_rate_limited(self, attempt: int):
+        """
+        Halves the concurrency limit and pauses admissions after a 429 response.
+        """
+        backoff = self.backoff_seconds * (2 ** attempt)
+        with self._condition:
+            self._stats["rate_limited"] += 1
+            self._concurrency_limit = max(1.0, self._concurrency_limit / 2)
+            self._paused_until = max(self._paused_until, time.monotonic() + backoff)
+            self._condition.notify_all()
+        logger.warning(f"LLM call rate limited, concurrency limit lowered to {int(self._concurrency_limit)}, retrying in {backoff:.1f}s")
+
+    def _on_transient_error(self, error: Exception, attempt: int):
+        """
+        Waits before retrying a call that failed with a transient error. Other calls are not held back.
+        """
+        backoff = self.backoff_seconds * (2 ** attempt)
+        with self._condition:
+            self._stats["transient_errors"] += 1
+        logger.warning(f"LLM call failed with a transient error ({type(error).__name__}: {error}), retrying in {backoff:.1f}s")
+        time.sleep(backoff)
+
+    @staticmethod
+    def _is_transient_error(error: Exception) -> bool:
+        """
+        Checks whether an error is a timeout, a connection error or a 5xx response of the provider.
+        """
+        status_code = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+        if isinstance(status_code, int):
+            return status_code >= 500
+        return isinstance(error, (TimeoutError, ConnectionError)) or type(error).__name__ in (
+            "APITimeoutError", "APIConnectionError", "InternalServerError", "ServiceUnavailableError", "TimeoutException", "ConnectError"
+        )
+
+    @staticmethod
+    def _is_rate_limit_error(error: Exception) -> bool:
+        """
+        Checks whether an error is a 429 response of the provider.
+        """
+        status_code = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+        return status_code == 429 or type(error).__name__ == "RateLimitError"
+
+    def has_spare_capacity(self) -> bool:
+        """
+        Whether no call is waiting and less than half of the concurrency limit is in use, i.e. whether
+        speculative work can run without delaying user-facing calls.
+        """
+        with self._condition:
+            return not self._queue and self._in_flight < int(self._concurrency_limit) / 2
+
+    def get_stats(self) -> dict:
+        """
+        Reports the scheduler counters and its current state.
+
+        Returns:
+            dict: The number of upstream calls, coalesced calls, rate-limited calls, transient errors retried and
+                  failed calls, the calls, the average queue wait and the average and largest prompt tokens per
+                  priority, and the current concurrency limit, in-flight and queued calls.
+        """
+        with self._condition:
+            return {
+                "calls": self._stats["calls"],
+                "coalesced": self._stats["coalesced"],
+                "rate_limited": self._stats["rate_limited"],
+                "transient_errors": self._stats["transient_errors"],
+                "failed": self._stats["failed"],
+                "calls_by_priority": dict(self._stats["calls_by_priority"]),
+                "average_queue_wait_seconds": {
+                    name: wait / self._stats["calls_by_priority"][name] if self._stats["calls_by_priority"][name] else 0.0
+                    for name, wait in self._stats["queue_wait_seconds"].items()
+                },
+                "average_prompt_tokens": {
+                    name: tokens / self._stats["calls_by_priority"][name] if self._stats["calls_by_priority"][name] else 0.0
+                    for name, tokens in self._stats["prompt_tokens"].items()
+                },
+                "max_prompt_tokens": dict(self._stats["max_prompt_tokens"]),
+                "concurrency_limit": int(self._concurrency_limit),
+                "in_flight": self._in_flight,
+                "queued": len(self._queue)
+            }
@@ -1,5 +1,8 @@
 from enum import Enum
 
+# Answer given when the context does not contain the answer, by the model or by the confidence gate
+FALLBACK_ANSWER = "Sorry, I do not know. You may search at https://about.gitlab.com/direction/ or https://handbook.gitlab.com/"
+
 class QueryPrompt(Enum):
     """
     Enum for defining query prompt templates used across various services or application components.
@@ -29,7 +32,7 @@ class QueryPrompt(Enum):
     REFORMATTING_QUERY = """
    **Role**: Query Reformatter Assistant  
    **Guidelines**:  
-   1. Analyze the provided chat history of the user.  
+   1. Analyze the provided summary of the earlier conversation and the recent chat history of the user.  
    2. Reformulate the user query to make it independently understandable if it relates to the chat history.  
    3. If the query is unrelated to the chat history, return it unchanged.  
    4. Only return the modified or original query—no additional text or explanation.  
@@ -38,8 +41,27 @@ class QueryPrompt(Enum):
    **User Query**:  
    {question}  
 
+   **Summary of Earlier Conversation**:  
+   {history_summary}  
+
    **User Chat History**:  
    {chat_history}  
+   """
+
+    HISTORY_SUMMARY = """
+   **Role**: Conversation Summarizer Assistant  
+   **Guidelines**:  
+   1. Update the existing summary of a conversation between a user and an assistant with the new turns.  
+   2. Keep the topics, names, URLs and facts the user may refer back to.  
+   3. Drop greetings, repetitions and details that are no longer relevant.  
+   4. Keep the summary under {max_words} words.  
+   5. Only return the updated summary—no additional text or explanation.  
+
+   **Existing Summary**:  
+   {summary}  
+
+   **New Turns**:  
+   {turns}  
    """
 
     RELATED_QUERIES = """
@@ -0,0 +1,451 @@
+import hashlib
+import itertools
+import os
+import socket
+import subprocess
+import sys
+import threading
+from collections import defaultdict
+from concurrent.futures import Future
+from multiprocessing.connection import Connection
+from typing import Dict, List, Optional
+import faiss
+import numpy as np
+from common.logger import logger
+
+# Shard index files saved under the shards folder of a partition
+SHARD_FILE_NAME = "shard-{}.faiss"
+
+# Folder the `common` package is imported from, added to the import path of the shard workers
+SOURCE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def shard_for(key: str, shards: int) -> int:
+    """
+    Returns the shard owning a key, by rendezvous (highest random weight) hashing.
+
+    Every shard gets a stable pseudo-random weight for the key and the highest one wins, so growing
+    from n to n + 1 shards only moves the keys the new shard wins, about 1 / (n + 1) of them, and
+    shrinking only moves the keys of the removed shards.
+
+    Args:
+        key (str): The key, e.g. the source URL of a document.
+        shards (int): Number of shards.
+
+    Returns:
+        int: The shard number.
+    """
+    return max(range(shards), key=lambda shard: hashlib.blake2b(f"{shard}:{key}".encode(), digest_size=8).digest())
+
+
+def _serve_shard(connection, dimension: int, index_path: Optional[str]):
+    """
+    Main loop of a shard worker process: holds one Faiss index and runs the commands sent over the pipe,
+    one at a time, replying with (request id, result, error).
+    """
+    # Shards run side by side, so each one searches on a single core
+    faiss.omp_set_num_threads(1)
+    if index_path and os.path.exists(index_path):
+        index = faiss.read_index(index_path)
+    else:
+        index = faiss.IndexIDMap2(faiss.IndexFlatL2(dimension))
+
+    while True:
+        try:
+            request_id, command, args = connection.recv()
+        except EOFError:
+            return
+        try:
+            if command == "add":
+                ids, vectors = args
+                index.add_with_ids(vectors, ids)
+                result = index.ntotal
+            elif command == "remove":
+                result = index.remove_ids(np.asarray(args, dtype="int64"))
+            elif command == "search":
+                queries, k, ids = args
+                parameters = faiss.SearchParameters(sel=faiss.IDSelectorBatch(ids)) if ids is not None else None
+                result = index.search(queries, k, params=parameters)
+            elif command == "reconstruct":
+                result = np.vstack([index.reconstruct(int(vector_id)) for vector_id in args]) if len(args) else np.empty((0, dimension), dtype="float32")
+            elif command == "ids":
+                result = faiss.vector_to_array(index.id_map)
+            elif command == "save":
+                faiss.write_index(index, args)
+                result = True
+            elif command == "stop":
+                connection.send((request_id, None, None))
+                return
+            else:
+                raise ValueError(f"Unknown shard command '{command}'")
+            connection.send((request_id, result, None))
+        except Exception as e:
+            connection.send((request_id, None, f"{type(e).__name__}: {e}"))
+
+
+class _ShardClient:
+    """
+    Connection to a shard worker process.
+
+    Workers are started as `python -m common.sharded_index` over one end of a socket pair rather than
+    through multiprocessing, whose spawned children would re-import the application's main module and
+    build another indexer. Requests are numbered and their replies are dispatched to futures by a
+    reader thread, so several threads can have requests in flight on the same shard.
+    """
+
+    def __init__(self, number: int, dimension: int, index_path: Optional[str] = None):
+        self.number = number
+        parent_socket, child_socket = socket.socketpair()
+        environment = dict(os.environ)
+        environment["PYTHONPATH"] = os.pathsep.join(filter(None, [SOURCE_ROOT, environment.get("PYTHONPATH")]))
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "common.sharded_index", str(child_socket.fileno()), str(dimension), index_path or ""],
+            pass_fds=[child_socket.fileno()],
+            env=environment
+        )
+        child_socket.close()
+        self._connection = Connection(parent_socket.detach())
+        self._send_lock = threading.Lock()
+        self._pending = {}  # Maps request ids to the futures waiting for their reply
+        self._request_ids = itertools.count()
+        self._reader = threading.Thread(target=self._read_replies, name=f"faiss-shard-{number}-reader", daemon=True)
+        self._reader.start()
+
+    def call(self, command: str, args=None) -> Future:
+        """
+        Sends a command to the shard and returns the future of its reply.
+        """
+        future = Future()
+        with self._send_lock:
+            request_id = next(self._request_ids)
+            self._pending[request_id] = future
+            try:
+                self._connection.send((request_id, command, args))
+            except Exception as e:
+                self._pending.pop(request_id, None)
+                future.set_exception(RuntimeError(f"Shard {self.number} is not reachable: {e}"))
+        return future
+
+    def _read_replies(self):
+        """
+        Reader thread: resolves the future of every reply, and fails the pending ones if the worker exits.
+        """
+        while True:
+            try:
+                request_id, result, error = self._connection.recv()
+            except (EOFError, OSError):
+                break
+            future = self._pending.pop(request_id, None)
+            if future is None:
+                continue
+            if error:
+                future.set_exception(RuntimeError(f"Shard {self.number} failed: {error}"))
+            else:
+                future.set_result(result)
+        for request_id in list(self._pending):
+            future = self._pending.pop(request_id, None)
+            if future is not None:
+                future.set_exception(RuntimeError(f"Shard {self.number} worker exited"))
+
+    def stop(self):
+        """
+        Stops the worker process.
+        """
+        try:
+            self.call("stop").result(timeout=10)
+        except Exception as e:
+            logger.warning(f"Shard {self.number} did not stop cleanly: {e}")
+        try:
+            self.process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.process.terminate()
+        self._connection.close()
+
+
+class ShardedIndex:
+    """
+    Flat L2 index split across shards, each one held by its own worker process.
+
+    Vectors are identified by int64 ids and assigned to a shard by rendezvous hashing of a key (the
+    source URL of their document), so all the chunks of a page live on the same shard. A search is
+    sent to every shard at once and the per-shard top-k are merged into the global top-k, so shards
+    search in parallel on separate cores. Changing the number of shards rebalances the vectors whose
+    owner changed.
+
+    The object mimics the parts of a Faiss index the langchain vector store uses (`d`, `ntotal` and
+    `search`), so it can be plugged into a FAISS vector store.
+    """
+
+    def __init__(self, dimension: int, shards: int, path: Optional[str] = None, keys: Optional[Dict[int, str]] = None):
+        """
+        Initializes the ShardedIndex class, starting one worker per shard.
+
+        Shard files saved under `path` are loaded; if their number differs from `shards`, the vectors
+        are rebalanced onto the new number of shards.
+
+        Args:
+            dimension (int): Dimension of the vectors.
+            shards (int): Number of shards.
+            path (str, optional): Folder of the shard files.
+            keys (dict, optional): Key of every vector id saved in the shard files.
+        """
+        if shards < 1:
+            raise ValueError(f"A sharded index needs at least one shard, got {shards}")
+        self.d = dimension
+        self.path = path
+        self._lock = threading.RLock()  # Serializes writes and rebalancing; searches do not take it
+        self._id_to_shard = {}
+        self._id_to_key = dict(keys or {})
+
+        saved_shards = self._saved_shard_count()
+        self._shards = [
+            _ShardClient(number, dimension, self._shard_file_path(number) if number < saved_shards else None)
+            for number in range(saved_shards or shards)
+        ]
+        for shard, ids in zip(self._shards, self._gather("ids")):
+            self._id_to_shard.update({int(vector_id): shard.number for vector_id in ids})
+        if len(self._shards) != shards:
+            self.resize(shards)
+
+    @property
+    def ntotal(self) -> int:
+        """
+        Number of vectors in the index.
+        """
+        return len(self._id_to_shard)
+
+    @property
+    def shard_count(self) -> int:
+        """
+        Number of shards.
+        """
+        return len(self._shards)
+
+    def _shard_file_path(self, number: int) -> str:
+        """
+        Returns the path of the file a shard is saved to.
+        """
+        return os.path.join(self.path, SHARD_FILE_NAME.format(number))
+
+    def _saved_shard_count(self) -> int:
+        """
+        Returns the number of consecutive shard files saved under the index path.
+        """
+        if not self.path:
+            return 0
+        count = 0
+        while os.path.exists(self._shard_file_path(count)):
+            count += 1
+        return count
+
+    def _gather(self, command: str, args=None, shards=None) -> list:
+        """
+        Sends a command to every shard at once and waits for all their replies.
+        """
+        futures = [shard.call(command, args) for shard in (shards if shards is not None else self._shards)]
+        return [future.result() for future in futures]
+
+    def add(self, ids, vectors, keys: List[Optional[str]]):
+        """
+        Adds vectors to the shards owning their keys.
+
+        Args:
+            ids (list): Unique int64 id of every vector.
+            vectors (list): The vectors.
+            keys (list): Key of every vector; vectors without a key are placed by their id.
+        """
+        ids = np.asarray(ids, dtype="int64")
+        vectors = np.ascontiguousarray(vectors, dtype="float32")
+        with self._lock:
+            shard_count = len(self._shards)
+            positions_by_shard = defaultdict(list)
+            for position, (vector_id, key) in enumerate(zip(ids.tolist(), keys)):
+                key = key if key is not None else str(vector_id)
+                self._id_to_key[vector_id] = key
+                positions_by_shard[shard_for(key, shard_count)].append(position)
+            futures = [
+                self._shards[number].call("add", (ids[positions], vectors[positions]))
+                for number, positions in positions_by_shard.items()
+            ]
+            for future in futures:
+                future.result()
+            for number, positions in positions_by_shard.items():
+                self._id_to_shard.update({int(ids[position]): number for position in positions})
+
+    def remove(self, ids) -> int:
+        """
+        Removes vectors from their shards.
+
+        Args:
+            ids (list): Ids of the vectors to remove; unknown ids are ignored.
+
+        Returns:
+            int: The number of vectors removed.
+        """
+        with self._lock:
+            ids_by_shard = defaultdict(list)
+            for vector_id in ids:
+                number = self._id_to_shard.get(int(vector_id))
+                if number is not None:
+                    ids_by_shard[number].append(int(vector_id))
+            futures = [self._shards[number].call("remove", shard_ids) for number, shard_ids in ids_by_shard.items()]
+            removed = sum(future.result() for future in futures)
+            for shard_ids in ids_by_shard.values():
+                for vector_id in shard_ids:
+                    del self._id_to_shard[vector_id]
+                    self._id_to_key.pop(vector_id, None)
+            return removed
+
+    def search(self, queries, k: int, ids=None):
+        """
+        Searches every shard in parallel and merges their results.
+
+        Args:
+            queries (np.ndarray): Query vectors, one per row.
+            k (int): Number of neighbours per query.
+            ids (list, optional): Ids the search is restricted to; every shard only gets its own, and
+                                  shards holding none of them are not searched.
+
+        Returns:
+            tuple: Distances and ids of the k nearest vectors of every query, like a Faiss index; missing
+                   results have the id -1.
+        """
+        queries = np.ascontiguousarray(queries, dtype="float32")
+        if ids is None:
+            futures = [shard.call("search", (queries, k, None)) for shard in list(self._shards)]
+        else:
+            shards = list(self._shards)
+            ids_by_shard = defaultdict(list)
+            for vector_id in ids:
+                number = self._id_to_shard.get(int(vector_id))
+                if number is not None and number < len(shards):
+                    ids_by_shard[number].append(int(vector_id))
+            futures = [
+                shards[number].call("search", (queries, k, np.asarray(shard_ids, dtype="int64")))
+                for number, shard_ids in ids_by_shard.items()
+            ]
+        replies = [future.result() for future in futures]
+        if not replies:
+            return np.full((len(queries), k), np.inf, dtype="float32"), np.full((len(queries), k), -1, dtype="int64")
+        distances = np.hstack([reply[0] for reply in replies])
+        ids = np.hstack([reply[1] for reply in replies])
+        # While a vector is being moved between shards it may be found on both of them
+        merged_distances = np.full((len(queries), k), np.inf, dtype="float32")
+        merged_ids = np.full((len(queries), k), -1, dtype="int64")
+        for row, order in enumerate(np.argsort(distances, axis=1, kind="stable")):
+            seen = set()
+            column = 0
+            for position in order:
+                vector_id = int(ids[row, position])
+                if vector_id < 0 or vector_id in seen:
+                    continue
+                seen.add(vector_id)
+                merged_distances[row, column] = distances[row, position]
+                merged_ids[row, column] = vector_id
+                column += 1
+                if column == k:
+                    break
+        return merged_distances, merged_ids
+
+    def reconstruct(self, ids) -> np.ndarray:
+        """
+        Returns the stored vectors of the given ids, in the same order.
+        """
+        ids = [int(vector_id) for vector_id in ids]
+        ids_by_shard = defaultdict(list)
+        for position, vector_id in enumerate(ids):
+            ids_by_shard[self._id_to_shard[vector_id]].append(position)
+        vectors = np.empty((len(ids), self.d), dtype="float32")
+        futures = {
+            number: self._shards[number].call("reconstruct", [ids[position] for position in positions])
+            for number, positions in ids_by_shard.items()
+        }
+        for number, future in futures.items():
+            vectors[ids_by_shard[number]] = future.result()
+        return vectors
+
+    def resize(self, shards: int) -> int:
+        """
+        Changes the number of shards and moves the vectors whose owner changed.
+
+        New shards are started before any vector moves; a moved vector is added to its new shard before
+        it is removed from the old one, so searches keep finding it throughout. Removed shards are
+        stopped once they are empty.
+
+        Args:
+            shards (int): The new number of shards.
+
+        Returns:
+            int: The number of vectors moved.
+        """
+        if shards < 1:
+            raise ValueError(f"A sharded index needs at least one shard, got {shards}")
+        with self._lock:
+            current = list(self._shards)
+            previous_count = len(current)
+            if shards > len(current):
+                current += [_ShardClient(number, self.d) for number in range(len(current), shards)]
+                self._shards = current
+
+            moves = defaultdict(list)  # Maps (old shard, new shard) to the ids moving between them
+            for vector_id, number in self._id_to_shard.items():
+                owner = shard_for(self._id_to_key.get(vector_id, str(vector_id)), shards)
+                if owner != number:
+                    moves[(number, owner)].append(vector_id)
+
+            moved = 0
+            for (source, target), ids in moves.items():
+                vectors = current[source].call("reconstruct", ids).result()
+                current[target].call("add", (np.asarray(ids, dtype="int64"), vectors)).result()
+                self._id_to_shard.update({vector_id: target for vector_id in ids})
+                current[source].call("remove", ids).result()
+                moved += len(ids)
+
+            if shards < len(current):
+                self._shards = current[:shards]
+                for shard in current[shards:]:
+                    shard.stop()
+            logger.info(f"Resharded index from {previous_count} to {shards} shards, moved {moved} of {self.ntotal} vectors")
+            return moved
+
+    def save(self, path: Optional[str] = None):
+        """
+        Saves every shard to its file, in parallel, and removes the files of shards that no longer exist.
+
+        Args:
+            path (str, optional): Folder to save to. Defaults to the folder the index was loaded from.
+        """
+        self.path = path or self.path
+        os.makedirs(self.path, exist_ok=True)
+        with self._lock:
+            futures = [shard.call("save", self._shard_file_path(shard.number)) for shard in self._shards]
+            for future in futures:
+                future.result()
+            number = len(self._shards)
+            while os.path.exists(self._shard_file_path(number)):
+                os.remove(self._shard_file_path(number))
+                number += 1
+
+    def shard_sizes(self) -> List[int]:
+        """
+        Returns the number of vectors held by every shard.
+        """
+        sizes = [0] * len(self._shards)
+        for number in list(self._id_to_shard.values()):
+            if number < len(sizes):
+                sizes[number] += 1
+        return sizes
+
+    def close(self):
+        """
+        Stops every shard worker.
+        """
+        with self._lock:
+            for shard in self._shards:
+                shard.stop()
+            self._shards = []
+
+
+if __name__ == "__main__":
+    # Entry point of a shard worker: <socket fd> <dimension> [<index path>]
+    _serve_shard(Connection(int(sys.argv[1])), int(sys.argv[2]), sys.argv[3] if len(sys.argv) > 3 else None)
@@ -0,0 +1,43 @@
+import threading
+from common.logger import logger
+
+_encoding = None
+_encoding_loaded = False
+_encoding_lock = threading.Lock()
+
+
+def _get_encoding(model: str):
+    """
+    Loads the tiktoken encoding of the chat model once. Returns None if it is not available,
+    e.g. when the encoding file cannot be downloaded.
+    """
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        with _encoding_lock:
+            if not _encoding_loaded:
+                try:
+                    import tiktoken
+                    _encoding = tiktoken.encoding_for_model(model)
+                except Exception as e:
+                    logger.warning(f"Tokenizer of {model} not available, estimating four characters per token: {e}")
+                    _encoding = None
+                _encoding_loaded = True
+    return _encoding
+
+
+def count_tokens(text: str, model: str = "gpt-4o") -> int:
+    """
+    Counts the tokens of a text with the tokenizer of the chat model, or estimates them at
+    four characters per token if the tokenizer is not available.
+
+    Args:
+        text (str): The text to count.
+        model (str): The chat model whose tokenizer to use.
+
+    Returns:
+        int: The number of tokens.
+    """
+    encoding = _get_encoding(model)
+    if encoding is None:
+        return len(text) // 4
+    return len(encoding.encode(text, disallowed_special=()))
@@ -1,14 +1,64 @@
 import faiss
 import numpy as np
 import os
+import re
+import json
+import pickle
+import shutil
+import threading
+from datetime import datetime, timezone
+from typing import Any, List, Optional
 from langchain.embeddings import OpenAIEmbeddings
 from langchain.document_loaders import UnstructuredURLLoader
 from langchain_community.vectorstores import FAISS
 from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
 from fastapi import HTTPException
+from common.dedup import NearDuplicateIndex
+from common.embedding_batcher import EmbeddingBatcher
+from common.sharded_index import ShardedIndex
 from common.logger import logger
 import uuid
 
+# Collection documents are indexed in when none is given
+DEFAULT_COLLECTION = "default"
+
+# Collection names are used as folder names, so they are restricted to a safe character set
+COLLECTION_NAME_PATTERN = re.compile(r"^[A-Za-z0-9_-]+$")
+
+# Vector storage modes: full float32 vectors in RAM, or quantized codes in RAM with the full vectors on disk
+STORAGE_MODES = ("flat", "sq8", "fp16", "pq")
+
+# File holding the full-precision vectors of a compressed partition, in index position order
+FULL_VECTORS_FILE_NAME = "vectors.f32"
+
+# Product quantization trains 256 centroids per sub-quantizer, so it needs at least that many vectors
+PQ_MIN_TRAINING_VECTORS = 256
+
+# Compaction of a compressed partition retrains its quantizer on a sample of at most that many live vectors,
+# then copies the live vectors batch by batch, so the full vectors are never all loaded in RAM
+COMPACTION_TRAINING_SAMPLE = 16384
+COMPACTION_BATCH_SIZE = 4096
+
+# File describing the shard layout of a sharded partition; its shard files live in the `shards` folder
+SHARDS_FILE_NAME = "shards.json"
+
+# Metadata values indexed for filtered searches; filters on other values, or on the unique document ids,
+# scan the docstore instead
+INDEXED_METADATA_TYPES = (str, int, float, bool)
+UNINDEXED_METADATA_KEYS = ("doc_id",)
+
+# Number of metadata filters whose matching positions are cached per partition
+FILTER_CACHE_SIZE = 256
+
+def distance_to_score(distance: float) -> float:
+    """
+    Converts the squared L2 distance between two normalized embeddings into their cosine similarity,
+    a score in [-1, 1] where higher is more relevant.
+    """
+    return 1 - distance / 2
+
 class Singleton:
     """
     A base class that implements the Singleton design pattern.
@@ -25,7 +75,7 @@ class Singleton:
         Args:
             *args: Positional arguments for the instance initialization.
             **kwargs: Keyword arguments for the instance initialization.
-        
+
         Returns:
             object: The single instance of the class.
         """
@@ -33,11 +83,1100 @@ class Singleton:
             cls._instances[cls] = super(Singleton, cls).__new__(cls)
         return cls._instances[cls]
 
+class IndexPartition:
+    """
+    A named partition (collection) of the Faiss index.
+
+    Every partition has its own Faiss index, docstore and tombstones and is stored in its own folder,
+    so a search restricted to some collections never scans the vectors of the others.
+    Vectors are computed by the caller, which keeps the partition independent of the embedding model.
+
+    In the `flat` storage mode the full float32 vectors are kept in RAM. The compressed modes (`sq8`,
+    `fp16` and `pq`) only keep quantized codes in RAM and write the full vectors to a memory-mapped
+    file next to the index: searches over-fetch candidates from the codes and re-rank them exactly
+    against the full vectors read from that file.
+
+    Tombstoned vectors are excluded inside the Faiss search by an id selector, so deletions do not make
+    searches fetch more candidates. Metadata filters are applied the same way: the positions of the
+    documents matching a filter are looked up in an index of the metadata values, and the search is
+    restricted to them, so a selective filter still returns k documents. The `pq` mode uses an IVF
+    index with a single list, which scans every code like IndexPQ but accepts the selectors.
+    """
+    def __init__(self, name: str, path: Optional[str], embeddings, dimension: Optional[int] = None,
+                 storage_mode: str = "flat", rerank_factor: int = 4, pq_subquantizers: int = 64):
+        """
+        Initializes the IndexPartition class and loads it from disk if it exists.
+
+        Args:
+            name (str): Name of the collection.
+            path (str, optional): Folder the partition is stored in. Without a path it is only kept in memory.
+            embeddings: Embedding model attached to the vector store, needed to load it back from disk.
+            dimension (int, optional): Dimension of the vectors, required if the partition is not on disk yet.
+            storage_mode (str): One of `flat`, `sq8`, `fp16` or `pq`.
+            rerank_factor (int): How many candidates per requested result are re-ranked in the compressed modes.
+            pq_subquantizers (int): Number of sub-quantizers (bytes per vector) of the `pq` mode.
+        """
+        if storage_mode not in STORAGE_MODES:
+            raise ValueError(f"Unknown storage mode '{storage_mode}', expected one of {STORAGE_MODES}")
+        self.name = name
+        self.path = path
+        self.embeddings = embeddings
+        self.storage_mode = storage_mode
+        self.rerank_factor = rerank_factor
+        self.pq_subquantizers = pq_subquantizers
+        # The vector store and the full-precision vectors are swapped together so that a search never
+        # pairs an index with vectors from another generation
+        self._state = (None, None)
+        self.trained_on = 0  # Number of vectors in a compressed index when its quantizer was last trained
+        self.source_to_ids = {}  # Maps every source URL to the docstore ids of its vectors
+        self.alias_to_id = {}  # Maps the source URLs of near-duplicate pages to the docstore id of the copy kept
+        self.duplicates = NearDuplicateIndex()  # MinHash signatures of the live documents
+        self.tombstones = set()  # Docstore ids of deleted vectors waiting for compaction
+        self.positions = {}  # Maps every docstore id to the position of its vector in the index
+        self._dead_selector = (None, 0, None)  # Search parameters excluding the tombstones, cached per vector store and tombstone count
+        self.metadata_index = {}  # Maps every metadata field to the docstore ids of the live documents, by value
+        self.metadata_version = 0  # Incremented on every change of the metadata index
+        self._metadata_lock = threading.Lock()
+        self._filter_selections = {}  # Live positions matching a metadata filter and their search parameters, by filter
+        self.last_compaction = None
+        self.load(dimension)
+
+    @property
+    def vector_store(self):
+        """
+        The langchain vector store holding the index, the docstore and the position to docstore id mapping.
+        """
+        return self._state[0]
+
+    @property
+    def full_vectors(self):
+        """
+        The full-precision vectors of a compressed index, memory-mapped from disk, or None in the flat mode.
+        """
+        return self._state[1]
+
+    @property
+    def compressed(self) -> bool:
+        """
+        Whether the partition keeps quantized codes in RAM instead of the full vectors.
+        """
+        return self.storage_mode != "flat"
+
+    def exists_on_disk(self) -> bool:
+        """
+        Checks whether the partition has been saved to its folder.
+        """
+        return bool(self.path) and os.path.exists(os.path.join(self.path, "index.faiss"))
+
+    def load(self, dimension: Optional[int] = None):
+        """
+        Loads the partition from disk if it exists, otherwise initializes an empty index.
+
+        An index saved with another storage mode is converted, and so is a sharded partition saved in
+        the same folder, so switching `FAISS_STORAGE_MODE` or going back to `FAISS_SHARDS=1` only
+        requires a restart.
+
+        Args:
+            dimension (int, optional): Dimension of the vectors, required if the partition is not on disk yet.
+        """
+        self.tombstones = self._load_tombstones()
+        if self.exists_on_disk():
+            vector_store = FAISS.load_local(self.path, self.embeddings, allow_dangerous_deserialization=True)
+            full_vectors = None if isinstance(vector_store.index, faiss.IndexFlat) else self._open_full_vectors(vector_store.index.d)
+            self._state = (vector_store, full_vectors)
+            self.trained_on = vector_store.index.ntotal
+            self._apply_storage_mode()
+            logger.info(f"Faiss index for collection '{self.name}' loaded from {self.path} ({self._index_kind(self.vector_store.index)})")
+        elif self.path and os.path.exists(os.path.join(self.path, SHARDS_FILE_NAME)):
+            self._convert_sharded()
+        else:
+            empty_vectors = np.empty((0, dimension), dtype="float32")
+            index = self._build_index(empty_vectors)
+            docstore = InMemoryDocstore()
+            vector_store = FAISS(embedding_function=self.embeddings, index=index, docstore=docstore, index_to_docstore_id={})
+            self._state = (vector_store, self._write_full_vectors(empty_vectors) if self.compressed else None)
+            logger.info(f"Faiss index for collection '{self.name}' not found, initialized a new vector store.")
+        self._rebuild_source_map()
+
+    def _convert_sharded(self):
+        """
+        Moves the live vectors of a sharded partition saved in the same folder back into an in-process
+        index of the storage mode, then removes its shard files. Tombstoned vectors are dropped on the way.
+        """
+        with open(os.path.join(self.path, SHARDS_FILE_NAME), "r") as layout_file:
+            layout = json.load(layout_file)
+        with open(os.path.join(self.path, "index.pkl"), "rb") as docstore_file:
+            docstore, index_to_docstore_id = pickle.load(docstore_file)
+        live_entries = [
+            (position, doc_id)
+            for position, doc_id in sorted(index_to_docstore_id.items())
+            if doc_id not in self.tombstones
+        ]
+        sharded_index = ShardedIndex(layout["dimension"], layout["shards"], os.path.join(self.path, "shards"))
+        try:
+            vectors = sharded_index.reconstruct([position for position, _ in live_entries])
+        finally:
+            sharded_index.close()
+
+        index = self._build_index(vectors)
+        docstore = InMemoryDocstore({doc_id: docstore.search(doc_id) for _, doc_id in live_entries})
+        index_to_docstore_id = {position: doc_id for position, (_, doc_id) in enumerate(live_entries)}
+        vector_store = FAISS(embedding_function=self.embeddings, index=index, docstore=docstore, index_to_docstore_id=index_to_docstore_id)
+        self._state = (vector_store, self._write_full_vectors(vectors) if self.compressed else None)
+        self.tombstones = set()
+        self.save()
+        os.remove(os.path.join(self.path, SHARDS_FILE_NAME))
+        shutil.rmtree(os.path.join(self.path, "shards"), ignore_errors=True)
+        logger.info(f"Converted collection '{self.name}' from {layout['shards']} shards to {self._index_kind(index)} storage")
+
+    def save(self):
+        """
+        Saves the partition and its tombstones to its folder.
+        """
+        if not self.path:
+            return
+        self.vector_store.save_local(self.path)
+        self._save_tombstones()
+
+    def _save_tombstones(self):
+        """
+        Saves the tombstoned docstore ids next to the Faiss index.
+        """
+        with open(self._tombstones_file_path(), "w") as tombstones_file:
+            json.dump(sorted(self.tombstones), tombstones_file)
+
+    def close(self):
+        """
+        Releases the resources held by the partition. In-process indexes hold none.
+        """
+
+    def _tombstones_file_path(self):
+        """
+        Returns the path of the file that persists the tombstoned docstore ids next to the Faiss index.
+        """
+        return os.path.join(self.path, "tombstones.json")
+
+    def _load_tombstones(self):
+        """
+        Loads the tombstoned docstore ids saved alongside the Faiss index, if any.
+
+        Returns:
+            set: The docstore ids of deleted vectors that have not been compacted yet.
+        """
+        if not self.path or not os.path.exists(self._tombstones_file_path()):
+            return set()
+        with open(self._tombstones_file_path(), "r") as tombstones_file:
+            return set(json.load(tombstones_file))
+
+    def _rebuild_source_map(self):
+        """
+        Rebuilds the mapping from source URL to docstore ids from the documents in the vector store,
+        along with the near-duplicate aliases and the MinHash signatures of the documents.
+
+        Every document also gets its docstore id in the `doc_id` metadata field, which is what the
+        search filter uses to hide tombstoned vectors.
+        """
+        self.source_to_ids = {}
+        self.alias_to_id = {}
+        self.duplicates = NearDuplicateIndex()
+        with self._metadata_lock:
+            self.metadata_index = {}
+            self.metadata_version += 1
+        self.positions = {doc_id: position for position, doc_id in self.vector_store.index_to_docstore_id.items()}
+        for doc_id in self.vector_store.index_to_docstore_id.values():
+            if doc_id in self.tombstones:
+                continue
+            document = self.vector_store.docstore.search(doc_id)
+            if isinstance(document, str):
+                # The docstore returns an error message instead of a document for unknown ids
+                continue
+            document.metadata["doc_id"] = doc_id
+            document.metadata.setdefault("collection", self.name)
+            self.source_to_ids.setdefault(document.metadata.get("source"), []).append(doc_id)
+            self.alias_to_id.update((alias, doc_id) for alias in document.metadata.get("aliases", []))
+            self._index_metadata(doc_id, document.metadata)
+            signature = self.duplicates.signature(document.page_content)
+            if signature is not None:
+                self.duplicates.add(doc_id, signature)
+
+    def _full_vectors_file_path(self):
+        """
+        Returns the path of the file holding the full-precision vectors of a compressed index.
+        """
+        return os.path.join(self.path, FULL_VECTORS_FILE_NAME)
+
+    def _open_full_vectors(self, dimension: int):
+        """
+        Memory-maps the full-precision vectors saved next to the index, if any.
+        """
+        if not self.path or not os.path.exists(self._full_vectors_file_path()):
+            return None
+        if os.path.getsize(self._full_vectors_file_path()) == 0:
+            return np.empty((0, dimension), dtype="float32")
+        return np.memmap(self._full_vectors_file_path(), dtype="float32", mode="r").reshape(-1, dimension)
+
+    def _write_full_vectors(self, vectors: np.ndarray):
+        """
+        Replaces the full-precision vectors file and memory-maps it.
+
+        The new file is written next to the current one and renamed over it, so a search still
+        holding the previous mapping keeps reading the previous vectors.
+        """
+        if not self.path:
+            return np.array(vectors, dtype="float32")
+        os.makedirs(self.path, exist_ok=True)
+        temporary_path = self._full_vectors_file_path() + ".tmp"
+        np.ascontiguousarray(vectors, dtype="float32").tofile(temporary_path)
+        os.replace(temporary_path, self._full_vectors_file_path())
+        return self._open_full_vectors(vectors.shape[1])
+
+    def _append_full_vectors(self, vectors: np.ndarray):
+        """
+        Appends vectors to the full-precision vectors file and returns the refreshed mapping.
+        """
+        if not self.path:
+            return np.vstack([self.full_vectors, vectors])
+        os.makedirs(self.path, exist_ok=True)
+        with open(self._full_vectors_file_path(), "ab") as full_vectors_file:
+            np.ascontiguousarray(vectors, dtype="float32").tofile(full_vectors_file)
+        return self._open_full_vectors(vectors.shape[1])
+
+    @staticmethod
+    def _index_kind(index) -> str:
+        """
+        Returns the storage mode matching a Faiss index.
+        """
+        if isinstance(index, faiss.IndexFlat):
+            return "flat"
+        if isinstance(index, faiss.IndexIVFPQ):
+            return "pq"
+        if isinstance(index, faiss.IndexScalarQuantizer):
+            return "fp16" if index.sq.qtype == faiss.ScalarQuantizer.QT_fp16 else "sq8"
+        return type(index).__name__
+
+    def _new_index(self, dimension: int, count: int):
+        """
+        Creates an empty index of the partition's storage mode, for `count` vectors.
+
+        Product quantization needs at least `PQ_MIN_TRAINING_VECTORS` vectors and a dimension divisible
+        by the number of sub-quantizers; until then the `pq` mode falls back to `sq8`.
+        """
+        if self.storage_mode == "flat":
+            return faiss.IndexFlatL2(dimension)
+        if self.storage_mode == "fp16":
+            return faiss.IndexScalarQuantizer(dimension, faiss.ScalarQuantizer.QT_fp16, faiss.METRIC_L2)
+        if self.storage_mode == "pq" and count >= PQ_MIN_TRAINING_VECTORS and dimension % self.pq_subquantizers == 0:
+            # A single inverted list scans every code like IndexPQ, which does not support id selectors
+            return faiss.index_factory(dimension, f"IVF1,PQ{self.pq_subquantizers}", faiss.METRIC_L2)
+        return faiss.IndexScalarQuantizer(dimension, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_L2)
+
+    def _build_index(self, vectors: np.ndarray):
+        """
+        Builds an index of the partition's storage mode, trains it if needed and adds the vectors.
+        """
+        index = self._new_index(vectors.shape[1], len(vectors))
+        if not index.is_trained and len(vectors):
+            index.train(vectors)
+            self.trained_on = len(vectors)
+        if len(vectors):
+            index.add(vectors)
+        return index
+
+    def _rebuild_compressed(self, full_vectors, positions: np.ndarray):
+        """
+        Builds a compressed index of the full-precision vectors at the given positions and writes them to a
+        new full vectors file, in that order.
+
+        The quantizer is trained on at most `COMPACTION_TRAINING_SAMPLE` vectors spread evenly over the
+        positions. The vectors are then read from the memory-mapped file, added to the index and appended
+        to the new file `COMPACTION_BATCH_SIZE` at a time, so only the sample and one batch are held in RAM.
+        The new file is renamed over the current one once complete, like in `_write_full_vectors`.
+
+        Returns:
+            tuple: The index and the memory-mapped full vectors of the new file.
+        """
+        if not self.path:
+            vectors = np.asarray(full_vectors[positions], dtype="float32")
+            return self._build_index(vectors), vectors
+
+        dimension = full_vectors.shape[1]
+        index = self._new_index(dimension, len(positions))
+        if not index.is_trained and len(positions):
+            sample = positions[np.linspace(0, len(positions) - 1, min(len(positions), COMPACTION_TRAINING_SAMPLE)).astype("int64")]
+            index.train(np.asarray(full_vectors[sample], dtype="float32"))
+        # The index holds as many vectors as the quantizer was trained for, even if it only saw a sample
+        self.trained_on = len(positions)
+
+        os.makedirs(self.path, exist_ok=True)
+        temporary_path = self._full_vectors_file_path() + ".tmp"
+        with open(temporary_path, "wb") as full_vectors_file:
+            for start in range(0, len(positions), COMPACTION_BATCH_SIZE):
+                batch = np.ascontiguousarray(full_vectors[positions[start:start + COMPACTION_BATCH_SIZE]], dtype="float32")
+                index.add(batch)
+                batch.tofile(full_vectors_file)
+        os.replace(temporary_path, self._full_vectors_file_path())
+        return index, self._open_full_vectors(dimension)
+
+    def _all_vectors(self, vector_store, full_vectors) -> np.ndarray:
+        """
+        Returns the full-precision vectors of the partition, by position.
+        """
+        if full_vectors is not None and len(full_vectors) >= vector_store.index.ntotal:
+            return np.asarray(full_vectors[:vector_store.index.ntotal])
+        if vector_store.index.ntotal == 0:
+            return np.empty((0, vector_store.index.d), dtype="float32")
+        if not isinstance(vector_store.index, faiss.IndexFlat):
+            logger.warning(f"Full vectors of collection '{self.name}' are missing, using decoded approximations")
+        if isinstance(vector_store.index, faiss.IndexIVF):
+            vector_store.index.make_direct_map()
+        return vector_store.index.reconstruct_n(0, vector_store.index.ntotal)
+
+    def _apply_storage_mode(self):
+        """
+        Converts an index loaded from disk to the configured storage mode if it was saved with another one.
+        """
+        vector_store, full_vectors = self._state
+        index_kind = self._index_kind(vector_store.index)
+        if index_kind == self.storage_mode or (self.storage_mode == "pq" and index_kind == "sq8"):
+            if self.compressed and (full_vectors is None or len(full_vectors) < vector_store.index.ntotal):
+                # Rebuild the missing file from the decoded codes so that new vectors stay aligned with their positions
+                self._state = (vector_store, self._write_full_vectors(self._all_vectors(vector_store, None)))
+            return
+
+        vectors = self._all_vectors(vector_store, full_vectors)
+        vector_store.index = self._build_index(vectors)
+        if self.compressed:
+            self._state = (vector_store, self._write_full_vectors(vectors))
+        else:
+            self._state = (vector_store, None)
+        # Persist the converted index right away, before the full vectors of the previous mode go away
+        self.save()
+        if not self.compressed and self.path and os.path.exists(self._full_vectors_file_path()):
+            os.remove(self._full_vectors_file_path())
+        logger.info(f"Converted collection '{self.name}' from {index_kind} to {self._index_kind(vector_store.index)} storage")
+
+    @property
+    def dimension(self) -> int:
+        """
+        Dimension of the vectors stored in the partition.
+        """
+        return self.vector_store.index.d
+
+    def add(self, documents, vectors, ids: Optional[List[str]] = None) -> List[str]:
+        """
+        Adds documents along with their precomputed vectors to the partition.
+
+        Args:
+            documents (list): List of documents to add.
+            vectors (list): Embedding of every document, in the same order.
+            ids (list, optional): Docstore ids of the documents, as assigned by `deduplicate`. New ids are
+                                  generated when not given.
+
+        Returns:
+            list: The docstore ids assigned to the documents.
+        """
+        ids = ids or [str(uuid.uuid4()) for _ in range(len(documents))]
+        metadatas = [{**doc.metadata, "doc_id": doc_id, "collection": self.name} for doc, doc_id in zip(documents, ids)]
+        texts = [doc.page_content for doc in documents]
+        positions = self._add_vectors(texts, vectors, metadatas, ids)
+        self.positions.update(zip(ids, positions))
+
+        for metadata in metadatas:
+            self.source_to_ids.setdefault(metadata.get("source"), []).append(metadata["doc_id"])
+            self.alias_to_id.update((alias, metadata["doc_id"]) for alias in metadata.get("aliases", []))
+            self._index_metadata(metadata["doc_id"], metadata)
+        return ids
+
+    def _index_metadata(self, doc_id: str, metadata: dict):
+        """
+        Registers the metadata values of a live document in the index used by filtered searches.
+        """
+        with self._metadata_lock:
+            for key, value in metadata.items():
+                if key not in UNINDEXED_METADATA_KEYS and isinstance(value, INDEXED_METADATA_TYPES):
+                    self.metadata_index.setdefault(key, {}).setdefault(value, set()).add(doc_id)
+            self.metadata_version += 1
+
+    def _unindex_metadata(self, doc_id: str, metadata: dict):
+        """
+        Removes the metadata values of a document from the index used by filtered searches.
+        """
+        with self._metadata_lock:
+            for key, value in metadata.items():
+                doc_ids = self.metadata_index.get(key, {}).get(value) if isinstance(value, INDEXED_METADATA_TYPES) else None
+                if doc_ids is not None:
+                    doc_ids.discard(doc_id)
+                    if not doc_ids:
+                        del self.metadata_index[key][value]
+            self.metadata_version += 1
+
+    def deduplicate(self, documents, threshold: float, exclude=()):
+        """
+        Folds the near-duplicates of already indexed documents, or of earlier documents of the same batch,
+        into aliases, so that their content is only embedded and stored once.
+
+        The source URL of a near-duplicate is appended to the `aliases` metadata of the document kept.
+        Aliases of documents already in the docstore are only returned, to be recorded with `add_aliases`
+        once the batch is added. The other documents get their docstore ids and MinHash signatures
+        registered right away, so they are matched by the rest of the batch; `forget` unregisters them
+        if they are not added.
+
+        Args:
+            documents (list): The documents about to be indexed.
+            threshold (float): Minimum estimated Jaccard similarity of the shingles of two near-duplicates.
+            exclude (optional): Docstore ids that must not be matched, e.g. the documents being replaced.
+
+        Returns:
+            tuple: The documents to embed and index, their docstore ids, the (docstore id, source URL)
+                   aliases of documents already indexed, and the number of near-duplicates folded.
+        """
+        unique_documents, ids, aliases = [], [], []
+        batch_documents = {}  # Documents of the batch by docstore id, not in the docstore yet
+        folded = 0
+        for document in documents:
+            signature = self.duplicates.signature(document.page_content)
+            match = self.duplicates.find(signature, threshold, exclude=exclude) if signature is not None else None
+            if match is not None:
+                doc_id, similarity = match
+                kept = batch_documents.get(doc_id) or self.vector_store.docstore.search(doc_id)
+                if not isinstance(kept, str):
+                    if doc_id in batch_documents:
+                        self._add_alias(kept, doc_id, document.metadata.get("source"), in_docstore=False)
+                    else:
+                        aliases.append((doc_id, document.metadata.get("source")))
+                    logger.info(f"{document.metadata.get('source')} is a near-duplicate of {kept.metadata.get('source')} (similarity {similarity:.2f})")
+                    folded += 1
+                    continue
+
+            doc_id = str(uuid.uuid4())
+            if signature is not None:
+                self.duplicates.add(doc_id, signature)
+            batch_documents[doc_id] = document
+            unique_documents.append(document)
+            ids.append(doc_id)
+        return unique_documents, ids, aliases, folded
+
+    def add_aliases(self, aliases):
+        """
+        Records near-duplicate source URLs in the metadata of the indexed documents kept for them.
+
+        Args:
+            aliases (list): (docstore id, source URL) pairs, as returned by `deduplicate`.
+        """
+        for doc_id, alias in aliases:
+            document = self.vector_store.docstore.search(doc_id)
+            if not isinstance(document, str) and doc_id not in self.tombstones:
+                self._add_alias(document, doc_id, alias, in_docstore=True)
+
+    def _add_alias(self, document, doc_id: str, alias: Optional[str], in_docstore: bool):
+        """
+        Records the source URL of a near-duplicate page in the metadata of the document kept for it.
+        """
+        if not alias or alias == document.metadata.get("source"):
+            return
+        aliases = document.metadata.setdefault("aliases", [])
+        if alias not in aliases:
+            aliases.append(alias)
+        if in_docstore:
+            self.alias_to_id[alias] = doc_id
+
+    def forget(self, ids: List[str]):
+        """
+        Unregisters the signatures of documents that `deduplicate` accepted but that were not added.
+        """
+        for doc_id in ids:
+            self.duplicates.remove(doc_id)
+
+    def _add_vectors(self, texts, vectors, metadatas, ids) -> List[int]:
+        """
+        Adds the documents and their vectors to the vector store of the partition.
+
+        Returns:
+            list: The positions of the vectors in the index.
+        """
+        start = self.vector_store.index.ntotal
+        if self.compressed:
+            self._add_compressed(texts, np.asarray(vectors, dtype="float32"), metadatas, ids)
+        else:
+            self.vector_store.add_embeddings(list(zip(texts, vectors)), metadatas=metadatas, ids=ids)
+        return list(range(start, start + len(ids)))
+
+    def _add_compressed(self, texts, vectors: np.ndarray, metadatas, ids):
+        """
+        Adds vectors to a compressed index, writing their full-precision copy to disk first.
+
+        An index that has not been trained yet is trained on every vector available.
+        """
+        vector_store = self.vector_store
+        start = vector_store.index.ntotal
+        full_vectors = self._append_full_vectors(vectors)
+        self._state = (vector_store, full_vectors)
+        if vector_store.index.is_trained:
+            vector_store.index.add(vectors)
+        else:
+            vector_store.index = self._build_index(np.asarray(full_vectors[:start + len(vectors)]))
+
+        vector_store.docstore.add({doc_id: Document(page_content=text, metadata=metadata) for text, metadata, doc_id in zip(texts, metadatas, ids)})
+        vector_store.index_to_docstore_id.update({start + offset: doc_id for offset, doc_id in enumerate(ids)})
+
+    def needs_rebuild(self) -> bool:
+        """
+        Whether a compressed index should be retrained, because it grew well past the vectors its
+        quantizer was trained on or because the `pq` mode could not be used yet.
+        """
+        if not self.compressed:
+            return False
+        index = self.vector_store.index
+        if self.storage_mode == "pq" and self._index_kind(index) != "pq":
+            return index.ntotal >= PQ_MIN_TRAINING_VECTORS and index.d % self.pq_subquantizers == 0
+        return self._index_kind(index) == "sq8" and index.ntotal >= 2 * max(self.trained_on, 1)
+
+    def delete_source(self, source: str) -> int:
+        """
+        Tombstones all the vectors of a source URL.
+
+        A source that is a near-duplicate alias is removed from the aliases of the document kept for it.
+        A document that still has aliases is not tombstoned: its first alias becomes its source, since
+        it still holds the content of the other pages.
+
+        Args:
+            source (str): The source URL whose documents should be deleted.
+
+        Returns:
+            int: The number of documents tombstoned, reassigned or unaliased.
+        """
+        affected = 0
+        alias_of = self.alias_to_id.pop(source, None)
+        if alias_of is not None:
+            document = self.vector_store.docstore.search(alias_of)
+            if not isinstance(document, str) and source in document.metadata.get("aliases", []):
+                document.metadata["aliases"].remove(source)
+            affected += 1
+
+        for doc_id in self.source_to_ids.pop(source, []):
+            document = self.vector_store.docstore.search(doc_id)
+            aliases = [] if isinstance(document, str) else document.metadata.get("aliases", [])
+            if aliases:
+                new_source = aliases.pop(0)
+                self._unindex_metadata(doc_id, document.metadata)
+                document.metadata["source"] = new_source
+                self._index_metadata(doc_id, document.metadata)
+                self.alias_to_id.pop(new_source, None)
+                self.source_to_ids.setdefault(new_source, []).append(doc_id)
+            else:
+                self._tombstone(doc_id)
+            affected += 1
+        return affected
+
+    def _tombstone(self, doc_id: str):
+        """
+        Marks a vector as deleted; the next searches exclude it and the next compaction removes it.
+        """
+        self.tombstones.add(doc_id)
+        self.duplicates.remove(doc_id)
+        document = self.vector_store.docstore.search(doc_id)
+        if not isinstance(document, str):
+            self._unindex_metadata(doc_id, document.metadata)
+
+    def ids_deleted_with(self, sources) -> set:
+        """
+        Returns the docstore ids that deleting all the given sources would tombstone, i.e. the documents
+        whose source and near-duplicate aliases are all among them.
+        """
+        sources = set(sources)
+        doomed_ids = set()
+        for source in sources:
+            for doc_id in self.source_to_ids.get(source, []):
+                document = self.vector_store.docstore.search(doc_id)
+                aliases = [] if isinstance(document, str) else document.metadata.get("aliases", [])
+                if sources.issuperset(aliases):
+                    doomed_ids.add(doc_id)
+        return doomed_ids
+
+    def _matches(self, metadata: dict, metadata_filter: Optional[dict]) -> bool:
+        """
+        Search filter that hides tombstoned vectors and documents not matching the metadata filter.
+
+        A filter value that is a list matches any of its items; any other value must be equal.
+        """
+        if metadata.get("doc_id") in self.tombstones:
+            return False
+        for key, value in (metadata_filter or {}).items():
+            if isinstance(value, list):
+                if metadata.get(key) not in value:
+                    return False
+            elif metadata.get(key) != value:
+                return False
+        return True
+
+    def search_by_vector(self, vector, k: int = 4, metadata_filter: Optional[dict] = None):
+        """
+        Searches the partition for the documents closest to a query vector.
+
+        Tombstoned vectors and documents not matching the metadata filter are excluded by the index
+        itself, so only `k` candidates are fetched, or `rerank_factor` times more in the compressed
+        modes, which are re-ranked by their exact L2 distance to the query against the memory-mapped
+        full-precision vectors.
+
+        Args:
+            vector (list): The query embedding.
+            k (int): Number of documents to return.
+            metadata_filter (dict, optional): Metadata the returned documents must match.
+
+        Returns:
+            list: (document, distance) pairs sorted by increasing distance.
+        """
+        vector_store, full_vectors = self._state
+        candidates = vector_store.index.ntotal
+        if metadata_filter:
+            candidates = len(self._filter_selection(vector_store, metadata_filter)[0])
+        if candidates == 0:
+            return []
+        query = np.asarray([vector], dtype="float32")
+        fetch_k = min(k * self.rerank_factor if self.compressed else k, candidates)
+
+        distances, positions = self._search_index(vector_store, query, fetch_k, metadata_filter)
+        found = positions[0] >= 0
+        positions, distances = positions[0][found], distances[0][found]
+        if full_vectors is not None:
+            in_file = positions < len(full_vectors)
+            positions, distances = positions[in_file], distances[in_file]
+            candidates = np.asarray(full_vectors[positions])
+            distances = ((candidates - query) ** 2).sum(axis=1)
+
+        results = []
+        for rank in np.argsort(distances, kind="stable"):
+            doc_id = vector_store.index_to_docstore_id.get(int(positions[rank]))
+            document = vector_store.docstore.search(doc_id) if doc_id else None
+            # Documents deleted or changed since the search started are still left out
+            if document is None or isinstance(document, str) or not self._matches(document.metadata, metadata_filter):
+                continue
+            results.append((document, float(distances[rank])))
+            if len(results) == k:
+                break
+        return results
+
+    def _search_index(self, vector_store, query: np.ndarray, k: int, metadata_filter: Optional[dict] = None):
+        """
+        Searches the Faiss index of a vector store for the k closest live vectors matching the metadata filter.
+
+        Returns:
+            tuple: The distances and positions of the vectors found, the missing ones having the position -1.
+        """
+        if metadata_filter:
+            parameters = self._filter_selection(vector_store, metadata_filter)[1]
+        else:
+            parameters = self._search_parameters(vector_store)
+        return vector_store.index.search(query, k, params=parameters)
+
+    @staticmethod
+    def _selector_parameters(index, selector):
+        """
+        Wraps an id selector into the search parameters of an index.
+        """
+        if isinstance(index, faiss.IndexIVF):
+            parameters = faiss.SearchParametersIVF(sel=selector, nprobe=index.nlist)
+        else:
+            parameters = faiss.SearchParameters(sel=selector)
+        # The parameters only hold a pointer to the selector, which must stay alive with them
+        parameters.selector = selector
+        return parameters
+
+    def _search_parameters(self, vector_store):
+        """
+        Returns the search parameters excluding the tombstoned vectors of a vector store, or None when
+        there are none. They are rebuilt only after the tombstones changed.
+        """
+        cached_store, cached_count, parameters = self._dead_selector
+        tombstone_count = len(self.tombstones)
+        if cached_store is vector_store and cached_count == tombstone_count:
+            return parameters
+
+        # Ids tombstoned before a compaction swapped in a new vector store are no longer in it
+        dead_positions = [
+            position for position in (self.positions.get(doc_id) for doc_id in list(self.tombstones))
+            if position is not None and vector_store.index_to_docstore_id.get(position) in self.tombstones
+        ]
+        parameters = None
+        if dead_positions:
+            selector = faiss.IDSelectorNot(faiss.IDSelectorBatch(np.asarray(dead_positions, dtype="int64")))
+            parameters = self._selector_parameters(vector_store.index, selector)
+        self._dead_selector = (vector_store, tombstone_count, parameters)
+        return parameters
+
+    def _filter_selection(self, vector_store, metadata_filter: dict):
+        """
+        Returns the positions of the live vectors of a vector store matching a metadata filter, along
+        with the search parameters restricting a search to them. They are cached per filter until the
+        documents or the tombstones change.
+        """
+        filter_key = json.dumps(metadata_filter, sort_keys=True, default=str)
+        state = (vector_store, self.metadata_version, len(self.tombstones))
+        cached = self._filter_selections.get(filter_key)
+        if cached is not None and cached[0][0] is vector_store and cached[0][1:] == state[1:]:
+            return cached[1], cached[2]
+
+        dead_ids = set(self.tombstones)
+        allowed = []
+        for doc_id in self._ids_matching(vector_store, metadata_filter) - dead_ids:
+            position = self.positions.get(doc_id)
+            # Ids added after a compaction started are not in the vector store it swapped in
+            if position is not None and vector_store.index_to_docstore_id.get(position) == doc_id:
+                allowed.append(position)
+        allowed = np.asarray(sorted(allowed), dtype="int64")
+        parameters = self._selection_parameters(vector_store, allowed) if len(allowed) else None
+        if len(self._filter_selections) >= FILTER_CACHE_SIZE:
+            self._filter_selections.clear()
+        self._filter_selections[filter_key] = (state, allowed, parameters)
+        return allowed, parameters
+
+    def _selection_parameters(self, vector_store, allowed: np.ndarray):
+        """
+        Returns the search parameters restricting a search to the given positions.
+        """
+        return self._selector_parameters(vector_store.index, faiss.IDSelectorBatch(allowed))
+
+    def _ids_matching(self, vector_store, metadata_filter: dict) -> set:
+        """
+        Returns the docstore ids of the documents matching a metadata filter, from the metadata index.
+        Filters on values that are not indexed scan the docstore instead.
+        """
+        matching = None
+        for key, value in metadata_filter.items():
+            values = value if isinstance(value, list) else [value]
+            if key in UNINDEXED_METADATA_KEYS or not all(isinstance(item, INDEXED_METADATA_TYPES) for item in values):
+                ids = set()
+                for doc_id in list(vector_store.index_to_docstore_id.values()):
+                    document = vector_store.docstore.search(doc_id)
+                    if not isinstance(document, str) and self._matches(document.metadata, {key: value}):
+                        ids.add(doc_id)
+            else:
+                with self._metadata_lock:
+                    by_value = self.metadata_index.get(key, {})
+                    ids = set().union(*(by_value.get(item, ()) for item in values))
+            matching = ids if matching is None else matching & ids
+            if not matching:
+                break
+        return matching or set()
+
+    def compact(self) -> bool:
+        """
+        Rebuilds the Faiss index without its tombstoned vectors and swaps it in atomically.
+
+        Queries keep running against the current vector store while the new one is built, since they
+        only read the state that is replaced in a single assignment. Compressed indexes are retrained
+        on the live vectors at the same time, streaming them from the full vectors file (see
+        `_rebuild_compressed`).
+
+        Returns:
+            bool: True if the index was rebuilt.
+        """
+        dead_ids = set(self.tombstones)
+        if not dead_ids and not self.needs_rebuild():
+            return False
+
+        current_store, current_full_vectors = self._state
+        live_entries = [
+            (position, doc_id)
+            for position, doc_id in sorted(current_store.index_to_docstore_id.items())
+            if doc_id not in dead_ids
+        ]
+
+        live_positions = np.array([position for position, _ in live_entries], dtype="int64")
+        if self.compressed:
+            if current_full_vectors is None or len(current_full_vectors) < current_store.index.ntotal:
+                current_full_vectors = self._all_vectors(current_store, None)
+            index, full_vectors = self._rebuild_compressed(current_full_vectors, live_positions)
+        else:
+            index, full_vectors = self._build_index(self._all_vectors(current_store, None)[live_positions]), None
+        docstore = InMemoryDocstore({doc_id: current_store.docstore.search(doc_id) for _, doc_id in live_entries})
+        index_to_docstore_id = {position: doc_id for position, (_, doc_id) in enumerate(live_entries)}
+        vector_store = FAISS(embedding_function=self.embeddings, index=index, docstore=docstore, index_to_docstore_id=index_to_docstore_id)
+
+        # Swap the compacted vector store in with a single assignment
+        self._state = (vector_store, full_vectors)
+        self.positions = {doc_id: position for position, doc_id in index_to_docstore_id.items()}
+        self.tombstones -= dead_ids
+        self.last_compaction = datetime.now(timezone.utc).isoformat()
+        logger.info(f"Compacted collection '{self.name}', removed {len(dead_ids)} dead vectors ({self._index_kind(index)} storage)")
+        return True
+
+    def stats(self) -> dict:
+        """
+        Reports the number of live and dead vectors in the partition along with its memory footprint.
+
+        Returns:
+            dict: The total, live and dead vector counts, the dead vector ratio, the number of sources and of
+                  near-duplicate aliases, the storage mode, the bytes held in RAM by the index and the bytes
+                  of full vectors on disk.
+        """
+        vector_store, full_vectors = self._state
+        index = vector_store.index
+        total_vectors = len(vector_store.index_to_docstore_id)
+        dead_vectors = len(self.tombstones)
+        # The inverted lists of the `pq` mode also store the int64 id of every vector
+        bytes_per_vector = getattr(index, "code_size", index.d * 4) + (8 if isinstance(index, faiss.IndexIVF) else 0)
+        return {
+            "total_vectors": total_vectors,
+            "live_vectors": total_vectors - dead_vectors,
+            "dead_vectors": dead_vectors,
+            "dead_ratio": dead_vectors / total_vectors if total_vectors else 0.0,
+            "sources": len(self.source_to_ids),
+            "aliases": len(self.alias_to_id),
+            "last_compaction": self.last_compaction,
+            "storage_mode": self._index_kind(index),
+            "index_memory_bytes": bytes_per_vector * index.ntotal,
+            "full_vectors_disk_bytes": full_vectors.nbytes if full_vectors is not None else 0
+        }
+
+class ShardedIndexPartition(IndexPartition):
+    """
+    An IndexPartition whose vectors are spread across the worker processes of a ShardedIndex.
+
+    The langchain vector store keeps the docstore and the id mapping in this process and searches
+    through the sharded index, so tombstones, metadata filters and retrievers work as in a flat
+    partition. Tombstoned vectors are removed from their shards right away and vector ids are never
+    reused, so compaction only drops the dead documents from the docstore. Shards always keep full
+    float32 vectors. The shard files are stored in the `shards` folder of the partition, the docstore
+    in `index.pkl` and the layout in `shards.json`.
+    """
+    def __init__(self, name: str, path: Optional[str], embeddings, dimension: Optional[int] = None, shards: Optional[int] = None):
+        """
+        Initializes the ShardedIndexPartition class and loads it from disk if it exists.
+
+        Args:
+            name (str): Name of the collection.
+            path (str, optional): Folder the partition is stored in. Without a path it is only kept in memory.
+            embeddings: Embedding model attached to the vector store.
+            dimension (int, optional): Dimension of the vectors, required if the partition is not on disk yet.
+            shards (int, optional): Number of shards. Defaults to the number saved on disk, or 2 for a new partition.
+        """
+        self.shards = shards
+        self.next_id = 0  # Id of the next vector added, ids are positions in the id mapping
+        super().__init__(name, path, embeddings, dimension=dimension)
+
+    def _shards_dir(self) -> Optional[str]:
+        """
+        Returns the folder the shard files are stored in.
+        """
+        return os.path.join(self.path, "shards") if self.path else None
+
+    def _layout_file_path(self) -> str:
+        """
+        Returns the path of the file describing the shard layout.
+        """
+        return os.path.join(self.path, SHARDS_FILE_NAME)
+
+    def exists_on_disk(self) -> bool:
+        """
+        Checks whether the partition has been saved to its folder as a sharded partition.
+        """
+        return bool(self.path) and os.path.exists(self._layout_file_path())
+
+    def load(self, dimension: Optional[int] = None):
+        """
+        Loads the partition from disk if it exists, otherwise initializes an empty sharded index.
+
+        A partition saved with another number of shards is rebalanced, and an unsharded partition is
+        converted, so changing `FAISS_SHARDS` only requires a restart.
+
+        Args:
+            dimension (int, optional): Dimension of the vectors, required if the partition is not on disk yet.
+        """
+        self.tombstones = self._load_tombstones()
+        if self.exists_on_disk():
+            with open(self._layout_file_path(), "r") as layout_file:
+                layout = json.load(layout_file)
+            with open(os.path.join(self.path, "index.pkl"), "rb") as docstore_file:
+                docstore, index_to_docstore_id = pickle.load(docstore_file)
+            keys = {position: self._source_of(docstore, doc_id) for position, doc_id in index_to_docstore_id.items()}
+            self.shards = self.shards or layout["shards"]
+            index = ShardedIndex(layout["dimension"], self.shards, self._shards_dir(), keys=keys)
+            self._state = (FAISS(embedding_function=self.embeddings, index=index, docstore=docstore, index_to_docstore_id=index_to_docstore_id), None)
+            if layout["shards"] != self.shards:
+                self.save()
+            logger.info(f"Sharded Faiss index for collection '{self.name}' loaded from {self.path} ({index.shard_count} shards)")
+        elif IndexPartition.exists_on_disk(self):
+            self._convert_unsharded()
+        else:
+            index = ShardedIndex(dimension, self.shards or 2, self._shards_dir())
+            self.shards = index.shard_count
+            vector_store = FAISS(embedding_function=self.embeddings, index=index, docstore=InMemoryDocstore(), index_to_docstore_id={})
+            self._state = (vector_store, None)
+            logger.info(f"Faiss index for collection '{self.name}' not found, initialized a new sharded vector store.")
+        self.next_id = max(self.vector_store.index_to_docstore_id, default=-1) + 1
+        self._rebuild_source_map()
+        # Shards saved before their tombstoned vectors were removed still hold them
+        self.vector_store.index.remove([self.positions[doc_id] for doc_id in self.tombstones if doc_id in self.positions])
+
+    def _convert_unsharded(self):
+        """
+        Moves the vectors of an unsharded partition saved in the same folder to the shards, then removes
+        its index files.
+        """
+        flat_store = FAISS.load_local(self.path, self.embeddings, allow_dangerous_deserialization=True)
+        full_vectors = None if isinstance(flat_store.index, faiss.IndexFlat) else self._open_full_vectors(flat_store.index.d)
+        vectors = self._all_vectors(flat_store, full_vectors)
+        positions = sorted(flat_store.index_to_docstore_id)
+        self.shards = self.shards or 2
+        index = ShardedIndex(flat_store.index.d, self.shards, self._shards_dir())
+        if positions:
+            keys = [self._source_of(flat_store.docstore, flat_store.index_to_docstore_id[position]) for position in positions]
+            index.add(positions, vectors[positions], keys)
+        self._state = (FAISS(embedding_function=self.embeddings, index=index, docstore=flat_store.docstore, index_to_docstore_id=flat_store.index_to_docstore_id), None)
+        self.save()
+        for file_name in ("index.faiss", FULL_VECTORS_FILE_NAME):
+            if os.path.exists(os.path.join(self.path, file_name)):
+                os.remove(os.path.join(self.path, file_name))
+        logger.info(f"Converted collection '{self.name}' to {self.shards} shards")
+
+    @staticmethod
+    def _source_of(docstore, doc_id: str) -> Optional[str]:
+        """
+        Returns the source URL of a document, which is the sharding key of its vector.
+        """
+        document = docstore.search(doc_id)
+        return None if isinstance(document, str) else document.metadata.get("source")
+
+    def save(self):
+        """
+        Saves the shards, the docstore, the shard layout and the tombstones to the partition folder.
+        """
+        if not self.path:
+            return
+        vector_store = self.vector_store
+        os.makedirs(self.path, exist_ok=True)
+        vector_store.index.save(self._shards_dir())
+        temporary_path = os.path.join(self.path, "index.pkl.tmp")
+        with open(temporary_path, "wb") as docstore_file:
+            pickle.dump((vector_store.docstore, vector_store.index_to_docstore_id), docstore_file)
+        os.replace(temporary_path, os.path.join(self.path, "index.pkl"))
+        with open(self._layout_file_path(), "w") as layout_file:
+            json.dump({"shards": vector_store.index.shard_count, "dimension": vector_store.index.d}, layout_file)
+        self._save_tombstones()
+
+    def close(self):
+        """
+        Stops the shard worker processes.
+        """
+        if self.vector_store is not None:
+            self.vector_store.index.close()
+
+    def _add_vectors(self, texts, vectors, metadatas, ids) -> List[int]:
+        """
+        Registers the documents, then sends their vectors to the shards owning their source URLs.
+
+        Returns:
+            list: The ids of the vectors in the shards.
+        """
+        vector_store = self.vector_store
+        positions = list(range(self.next_id, self.next_id + len(ids)))
+        self.next_id += len(ids)
+        # The id mapping is filled first so that a search never finds a vector it cannot resolve
+        vector_store.docstore.add({doc_id: Document(page_content=text, metadata=metadata) for text, metadata, doc_id in zip(texts, metadatas, ids)})
+        vector_store.index_to_docstore_id.update(zip(positions, ids))
+        vector_store.index.add(positions, vectors, [metadata.get("source") for metadata in metadatas])
+        return positions
+
+    def _tombstone(self, doc_id: str):
+        """
+        Marks a vector as deleted and removes it from its shard, so searches no longer find it.
+        """
+        super()._tombstone(doc_id)
+        if doc_id in self.positions:
+            self.vector_store.index.remove([self.positions[doc_id]])
+
+    def _search_index(self, vector_store, query: np.ndarray, k: int, metadata_filter: Optional[dict] = None):
+        """
+        Searches the shards in parallel; they no longer hold the tombstoned vectors, and a metadata
+        filter restricts every shard to the ids of its matching vectors.
+        """
+        allowed = self._filter_selection(vector_store, metadata_filter)[0] if metadata_filter else None
+        return vector_store.index.search(query, k, ids=allowed)
+
+    def _selection_parameters(self, vector_store, allowed: np.ndarray):
+        """
+        Shards get the matching ids themselves, so no search parameters are built.
+        """
+        return None
+
+    def reshard(self, shards: int) -> int:
+        """
+        Changes the number of shards of the partition and rebalances its vectors.
+
+        Args:
+            shards (int): The new number of shards.
+
+        Returns:
+            int: The number of vectors moved.
+        """
+        moved = self.vector_store.index.resize(shards)
+        self.shards = shards
+        self.save()
+        return moved
+
+    def compact(self) -> bool:
+        """
+        Swaps in a vector store without the documents of the tombstoned vectors, which are already gone
+        from the shards.
+
+        Returns:
+            bool: True if dead vectors were removed.
+        """
+        dead_ids = set(self.tombstones)
+        if not dead_ids:
+            return False
+
+        current_store = self.vector_store
+        live_entries = {position: doc_id for position, doc_id in current_store.index_to_docstore_id.items() if doc_id not in dead_ids}
+        docstore = InMemoryDocstore({doc_id: current_store.docstore.search(doc_id) for doc_id in live_entries.values()})
+        vector_store = FAISS(embedding_function=self.embeddings, index=current_store.index, docstore=docstore, index_to_docstore_id=live_entries)
+
+        # Swap the compacted vector store in with a single assignment
+        self._state = (vector_store, None)
+        for doc_id in dead_ids:
+            self.positions.pop(doc_id, None)
+        self.tombstones -= dead_ids
+        self.last_compaction = datetime.now(timezone.utc).isoformat()
+        logger.info(f"Compacted collection '{self.name}', dropped {len(dead_ids)} dead documents of {current_store.index.shard_count} shards")
+        return True
+
+    def stats(self) -> dict:
+        """
+        Reports the statistics of an IndexPartition along with the number of vectors of every shard.
+        """
+        stats = super().stats()
+        stats["storage_mode"] = "flat"
+        stats["shards"] = self.vector_store.index.shard_sizes()
+        return stats
+
+class PartitionedRetriever(BaseRetriever):
+    """
+    Retriever that only searches the selected collections of a FaissIndexer.
+    """
+    indexer: Any
+    k: int = 4
+    collections: Optional[List[str]] = None
+    metadata_filter: Optional[dict] = None
+
+    def _get_relevant_documents(self, query: str, *, run_manager=None):
+        """
+        Returns the documents closest to the query across the selected collections.
+        """
+        results = self.indexer.search(query, k=self.k, collections=self.collections, metadata_filter=self.metadata_filter)
+        return [doc for doc, _ in results]
+
 class FaissIndexer(Singleton):
     """
     A class that handles the indexing and querying of documents in a Faiss index.
     The documents are embedded using OpenAI embeddings before being indexed in Faiss.
     This class also provides methods to fetch content from URLs, index it, and query the index for relevant results.
+
+    The index is split into named collections (e.g. per site or per team section), each one being an
+    IndexPartition. The default collection is stored at the index path itself, the other ones in its
+    `collections` folder. `FAISS_STORAGE_MODE` selects how the vectors are kept in memory (see
+    IndexPartition). `FAISS_SHARDS` spreads every collection across that many worker processes instead
+    (see ShardedIndexPartition).
     """
     def __init__(self, faiss_index_file_path: str = "faiss_index_file.index"):
         """
@@ -47,44 +1186,142 @@ class FaissIndexer(Singleton):
             faiss_index_file_path (str): Path where the Faiss index will be stored or loaded from.
         """
         self.embeddings = OpenAIEmbeddings()
+        # Query embeddings of concurrent requests are batched into shared upstream calls
+        self.query_embeddings = EmbeddingBatcher(self.embeddings)
         self.faiss_index = None
         self.faiss_index_file_path = faiss_index_file_path
-        self.documents = []  # To store the original documents
-        self.vector_store = None
+        # Maps every collection name to its IndexPartition; kept across re-initializations of the
+        # singleton so that load_faiss_index can release the previous partitions
+        self.partitions = getattr(self, "partitions", {})
+        self.compaction_dead_ratio = float(os.getenv("FAISS_COMPACTION_DEAD_RATIO", 0.25))
+        self.storage_mode = os.getenv("FAISS_STORAGE_MODE", "flat")
+        self.rerank_factor = int(os.getenv("FAISS_RERANK_FACTOR", 4))
+        self.pq_subquantizers = int(os.getenv("FAISS_PQ_SUBQUANTIZERS", 64))
+        # Number of shards of every collection; without it, sharded collections keep their saved layout
+        self.shards = int(os.environ["FAISS_SHARDS"]) if os.getenv("FAISS_SHARDS") else None
+        # Minimum shingle similarity of near-duplicate pages; above 1 disables near-duplicate detection
+        self.dedup_threshold = float(os.getenv("DEDUP_THRESHOLD", 0.9))
+        self._write_lock = threading.RLock()
+        self._compaction_thread = None
         self.load_faiss_index()
 
+    @property
+    def vector_store(self):
+        """
+        Vector store of the default collection.
+        """
+        return self.partitions[DEFAULT_COLLECTION].vector_store
+
+    def _collections_dir(self):
+        """
+        Returns the folder the non-default collections are stored in.
+        """
+        return os.path.join(self.faiss_index_file_path, "collections")
+
+    def _partition_path(self, collection: str):
+        """
+        Returns the folder a collection is stored in.
+        """
+        if collection == DEFAULT_COLLECTION:
+            return self.faiss_index_file_path
+        return os.path.join(self._collections_dir(), collection)
+
+    def _embedding_dimension(self) -> int:
+        """
+        Returns the dimension of the embeddings, taken from a loaded collection when there is one.
+        """
+        for partition in self.partitions.values():
+            return partition.dimension
+        return len(self.embeddings.embed_query("hello world"))
+
+    def _new_partition(self, collection: str) -> IndexPartition:
+        """
+        Loads a collection from disk, or initializes it if it does not exist yet.
+
+        Collections are sharded when `FAISS_SHARDS` is above 1, or when they were saved sharded and
+        `FAISS_SHARDS` is not set, in which case they keep their layout. With `FAISS_SHARDS=1`, collections
+        saved sharded are converted back to in-process indexes of `FAISS_STORAGE_MODE`.
+        """
+        path = self._partition_path(collection)
+        saved_sharded = os.path.exists(os.path.join(path, SHARDS_FILE_NAME))
+        on_disk = saved_sharded or os.path.exists(os.path.join(path, "index.faiss"))
+        dimension = None if on_disk else self._embedding_dimension()
+        if (self.shards or 1) > 1 or (saved_sharded and self.shards is None):
+            if self.storage_mode != "flat":
+                logger.warning(f"FAISS_STORAGE_MODE={self.storage_mode} is ignored for the sharded collection '{collection}'")
+            return ShardedIndexPartition(collection, path, self.embeddings, dimension=dimension, shards=self.shards)
+        return IndexPartition(
+            collection,
+            path,
+            self.embeddings,
+            dimension=dimension,
+            storage_mode=self.storage_mode,
+            rerank_factor=self.rerank_factor,
+            pq_subquantizers=self.pq_subquantizers
+        )
+
     def load_faiss_index(self):
         """
         Loads the Faiss index from disk if it exists, otherwise initializes the index as None.
         This method is called during initialization to ensure the index is available.
 
         If the Faiss index is not found at the specified path, it will initialize an empty Faiss index.
+        Every collection saved in the `collections` folder is loaded as well.
         """
         try:
-            if os.path.exists(self.faiss_index_file_path):
-                # Load the vector store
-                self.vector_store = FAISS.load_local(self.faiss_index_file_path, self.embeddings, allow_dangerous_deserialization=True)
-                logger.info(f"Faiss index loaded from {self.faiss_index_file_path}")
-            else:
-                # Create a new index and vector store
-                index = faiss.IndexFlatL2(len(self.embeddings.embed_query("hello world")))  # Use the embedding dimension
-                docstore = InMemoryDocstore()
-                self.vector_store = FAISS(embedding_function=self.embeddings, index=index, docstore=docstore, index_to_docstore_id={})
-                logger.info("Faiss index not found, initialized a new vector store.")
+            for partition in self.partitions.values():
+                partition.close()
+            self.partitions = {}
+            collections = []
+            if os.path.isdir(self._collections_dir()):
+                collections = sorted(
+                    name for name in os.listdir(self._collections_dir())
+                    if COLLECTION_NAME_PATTERN.match(name) and name != DEFAULT_COLLECTION
+                )
+            for collection in collections:
+                self.partitions[collection] = self._new_partition(collection)
+            self.partitions[DEFAULT_COLLECTION] = self._new_partition(DEFAULT_COLLECTION)
+            logger.info(f"Faiss index loaded with collections: {sorted(self.partitions)}")
         except Exception as e:
             logger.error(f"Error loading Faiss index: {str(e)}")
             raise HTTPException(status_code=500, detail=f"Error loading Faiss index: {str(e)}")
 
-    def save_faiss_index(self):
+    def get_partition(self, collection: str, create: bool = False) -> Optional[IndexPartition]:
+        """
+        Returns the partition of a collection.
+
+        Args:
+            collection (str): Name of the collection.
+            create (bool): Whether to create the collection if it does not exist.
+
+        Returns:
+            IndexPartition: The partition, or None if it does not exist and `create` is False.
+
+        Raises:
+            HTTPException: If the collection name is invalid.
+        """
+        if not COLLECTION_NAME_PATTERN.match(collection or ""):
+            raise HTTPException(status_code=400, detail=f"Invalid collection name: {collection}")
+        if collection not in self.partitions and create:
+            with self._write_lock:
+                if collection not in self.partitions:
+                    self.partitions[collection] = self._new_partition(collection)
+                    logger.info(f"Created collection '{collection}'")
+        return self.partitions.get(collection)
+
+    def save_faiss_index(self, collection: Optional[str] = None):
         """
         Saves the Faiss index to disk after modification.
+
+        Args:
+            collection (str, optional): Collection to save. All collections are saved when not given.
         """
         try:
-            if self.vector_store:
-                self.vector_store.save_local(self.faiss_index_file_path)
-                logger.info(f"Faiss index saved to {self.faiss_index_file_path}")
-            else:
-                raise HTTPException(status_code=500, detail="Faiss index is None, cannot save.")
+            collections = [collection] if collection else list(self.partitions)
+            for name in collections:
+                if name in self.partitions:
+                    self.partitions[name].save()
+            logger.info(f"Faiss index saved to {self.faiss_index_file_path} (collections: {collections})")
         except Exception as e:
             logger.error(f"Error saving Faiss index: {str(e)}")
             raise HTTPException(status_code=500, detail=f"Error saving Faiss index: {str(e)}")
@@ -92,7 +1329,7 @@ class FaissIndexer(Singleton):
     def fetch_url_content(self, url: str):
         """
         Fetches the content of a webpage from the given URL.
-        
+
         Args:
             url (str): The URL of the webpage to fetch content from.
 
@@ -111,64 +1348,348 @@ class FaissIndexer(Singleton):
             logger.error(f"Error fetching content from URL: {str(e)}")
             raise HTTPException(status_code=500, detail=f"Error fetching content from URL: {str(e)}")
 
-    def index_documents(self, documents):
+    def index_documents(self, documents, save: bool = True, replace: bool = False, collection: str = DEFAULT_COLLECTION,
+                        dedup_threshold: Optional[float] = None, replaced_sources: Optional[set] = None):
         """
         Indexes the provided documents into the Faiss index after embedding them using OpenAI embeddings.
 
+        Near-duplicates of documents already in the collection, or earlier in the batch, are not embedded:
+        their source URL is added to the `aliases` metadata of the document kept instead.
+
+        With `replace`, the previous vectors of the sources are only deleted once the new documents have
+        been embedded, so a failed embedding call leaves the current content of the pages in place.
+
         Args:
             documents (list): List of documents to index.
-        
+            save (bool): Whether to persist the Faiss index right away. Bulk ingestion disables it and
+                         saves once after the last batch.
+            replace (bool): Whether to delete the vectors previously indexed for the sources of the
+                            documents, so that re-ingesting a page updates it instead of duplicating it.
+            collection (str): Collection to index the documents in; it is created if it does not exist.
+            dedup_threshold (float, optional): Minimum shingle similarity of near-duplicates, above 1 to
+                                               disable the detection. Defaults to `DEDUP_THRESHOLD` or 0.9.
+            replaced_sources (set, optional): Sources already replaced earlier in the same ingestion, whose
+                                              vectors must not be deleted again. The sources replaced by this
+                                              call are added to it, so the chunks of a source spread across
+                                              several batches are all kept.
+
+        Returns:
+            dict: The number of documents received, indexed and folded into aliases as near-duplicates.
+
         Raises:
-            HTTPException: If there is an error during indexing.
+            HTTPException: If there is an error during indexing; the collection is left unchanged.
         """
+        result = {"documents": len(documents), "indexed": 0, "near_duplicates": 0}
+        threshold = dedup_threshold if dedup_threshold is not None else self.dedup_threshold
         try:
-            # Extract text content from the documents
-            texts = [doc.page_content for doc in documents]
+            partition = self.get_partition(collection, create=True)
+            with self._write_lock:
+                sources = {doc.metadata.get("source") for doc in documents} if replace else set()
+                if replaced_sources is not None:
+                    sources -= replaced_sources
+                ids, aliases = None, []
+                if threshold <= 1:
+                    # Documents about to be deleted must not absorb their own new version as a near-duplicate
+                    doomed_ids = partition.ids_deleted_with(sources)
+                    documents, ids, aliases, result["near_duplicates"] = partition.deduplicate(documents, threshold, exclude=doomed_ids)
 
-            # Add documents to the vector store, along with the metadata
-            ids = [str(uuid.uuid4()) for _ in range(len(documents))]
-            self.vector_store.add_texts(texts, metadatas=[doc.metadata for doc in documents], ids=ids)
+                # Embed the text content of the documents before touching the collection
+                try:
+                    vectors = self.embeddings.embed_documents([doc.page_content for doc in documents]) if documents else []
+                except Exception:
+                    partition.forget(ids or [])
+                    raise
 
-            # Store documents for later retrieval
-            self.documents.extend(documents)
+                for source in sources:
+                    self.delete_by_source(source, save=False, collection=collection)
+                if documents:
+                    partition.add(documents, vectors, ids=ids)
+                    result["indexed"] = len(documents)
+                partition.add_aliases(aliases)
+                if replaced_sources is not None:
+                    replaced_sources.update(sources)
 
-            # Save the Faiss index after adding the documents
-            self.save_faiss_index()
+                # Save the Faiss index after adding the documents
+                if save:
+                    self.save_faiss_index(collection)
 
+            # Retrain compressed indexes that outgrew their quantizer
+            if partition.needs_rebuild():
+                self.compact_in_background()
+
+        except HTTPException as e:
+            raise e
         except Exception as e:
             logger.error(f"Error indexing documents in Faiss: {str(e)}")
+            raise HTTPException(status_code=500, detail=f"Error indexing documents in Faiss: {str(e)}")
+        return result
+
+    def delete_by_source(self, source: str, save: bool = True, collection: Optional[str] = None) -> int:
+        """
+        Deletes all the vectors indexed for a source URL.
+
+        The vectors are tombstoned and hidden from searches right away; their memory is reclaimed by the
+        next compaction, which is started in the background once the dead vector ratio of a collection
+        exceeds `FAISS_COMPACTION_DEAD_RATIO`. Documents that near-duplicate pages still point to are kept
+        for them instead (see IndexPartition.delete_source).
 
-    def query_faiss(self, query: str):
+        Args:
+            source (str): The source URL whose documents should be deleted.
+            save (bool): Whether to persist the Faiss index right away.
+            collection (str, optional): Collection to delete from. All collections are searched when not given.
+
+        Returns:
+            int: The number of vectors deleted, reassigned or unaliased.
+        """
+        with self._write_lock:
+            collections = [collection] if collection else list(self.partitions)
+            deleted = 0
+            needs_compaction = False
+            for name in collections:
+                partition = self.partitions.get(name)
+                if partition is None:
+                    continue
+                partition_deleted = partition.delete_source(source)
+                if not partition_deleted:
+                    continue
+                deleted += partition_deleted
+                logger.info(f"Deleted {partition_deleted} vectors for source {source} from collection '{name}'")
+                if save:
+                    self.save_faiss_index(name)
+                needs_compaction = needs_compaction or partition.stats()["dead_ratio"] >= self.compaction_dead_ratio
+        if needs_compaction:
+            self.compact_in_background()
+        return deleted
+
+    def compact(self, collection: Optional[str] = None):
+        """
+        Rebuilds the Faiss index without its tombstoned vectors and swaps it in atomically.
+        Compressed indexes are retrained on their live vectors at the same time.
+
+        Queries keep running while the new index is built; writes are held back by the write lock
+        so that no document is lost during the rebuild.
+
+        Args:
+            collection (str, optional): Collection to compact. All collections are compacted when not given.
+
+        Returns:
+            dict: The index statistics after compaction.
+
+        Raises:
+            HTTPException: If there is an error while rebuilding the index.
+        """
+        try:
+            with self._write_lock:
+                collections = [collection] if collection else list(self.partitions)
+                for name in collections:
+                    if self.partitions[name].compact():
+                        self.save_faiss_index(name)
+                return self.get_index_stats()
+        except Exception as e:
+            logger.error(f"Error compacting Faiss index: {str(e)}")
+            raise HTTPException(status_code=500, detail=f"Error compacting Faiss index: {str(e)}")
+
+    def compact_in_background(self) -> bool:
+        """
+        Starts a compaction of every collection in a background thread unless one is already running.
+
+        Returns:
+            bool: True if a new compaction was started, False if one was already running.
+        """
+        with self._write_lock:
+            if self._compaction_thread and self._compaction_thread.is_alive():
+                return False
+            self._compaction_thread = threading.Thread(target=self._run_background_compaction, name="faiss-compaction", daemon=True)
+            self._compaction_thread.start()
+            return True
+
+    def _run_background_compaction(self):
+        """
+        Target of the background compaction thread; errors are logged instead of being raised.
+        """
+        try:
+            self.compact()
+        except HTTPException as e:
+            logger.error(f"Background compaction failed: {e.detail}")
+
+    def reshard(self, shards: int) -> dict:
+        """
+        Changes the number of shards of every collection and rebalances their vectors. Only the vectors
+        whose shard changed are moved. Unsharded collections are converted when sharding is enabled, and
+        a single shard converts sharded collections back to in-process indexes of the storage mode.
+
+        Args:
+            shards (int): The new number of shards.
+
+        Returns:
+            dict: The number of vectors moved and the index statistics after resharding.
+
+        Raises:
+            HTTPException: If the number of shards is invalid or resharding fails.
+        """
+        if shards < 1:
+            raise HTTPException(status_code=400, detail=f"Invalid number of shards: {shards}")
+        try:
+            with self._write_lock:
+                self.shards = shards
+                moved = 0
+                for name, partition in list(self.partitions.items()):
+                    sharded = isinstance(partition, ShardedIndexPartition)
+                    if sharded and shards > 1:
+                        moved += partition.reshard(shards)
+                    elif sharded or shards > 1:
+                        # The partition is saved, then loaded back from disk in its new layout
+                        partition.save()
+                        self.partitions[name] = self._new_partition(name)
+                        partition.close()
+                        moved += self.partitions[name].vector_store.index.ntotal
+                return {"moved_vectors": moved, **self.get_index_stats()}
+        except Exception as e:
+            logger.error(f"Error resharding Faiss index: {str(e)}")
+            raise HTTPException(status_code=500, detail=f"Error resharding Faiss index: {str(e)}")
+
+    def get_index_stats(self) -> dict:
+        """
+        Reports the number of live and dead vectors in the Faiss index, overall and per collection.
+
+        Returns:
+            dict: The total, live and dead vector counts, the dead vector ratio, the number of sources and
+                  of near-duplicate aliases, the storage mode, number of shards and memory footprint, the
+                  compaction status and the same statistics for every collection.
+        """
+        collections = {name: partition.stats() for name, partition in sorted(self.partitions.items())}
+        total_vectors = sum(stats["total_vectors"] for stats in collections.values())
+        dead_vectors = sum(stats["dead_vectors"] for stats in collections.values())
+        return {
+            "total_vectors": total_vectors,
+            "live_vectors": total_vectors - dead_vectors,
+            "dead_vectors": dead_vectors,
+            "dead_ratio": dead_vectors / total_vectors if total_vectors else 0.0,
+            "sources": sum(stats["sources"] for stats in collections.values()),
+            "aliases": sum(stats["aliases"] for stats in collections.values()),
+            "storage_mode": self.storage_mode,
+            "shards": self.shards,
+            "index_memory_bytes": sum(stats["index_memory_bytes"] for stats in collections.values()),
+            "full_vectors_disk_bytes": sum(stats["full_vectors_disk_bytes"] for stats in collections.values()),
+            "compaction_running": bool(self._compaction_thread and self._compaction_thread.is_alive()),
+            "collections": collections
+        }
+
+    def resolve_partitions(self, collections: Optional[List[str]] = None, metadata_filter: Optional[dict] = None):
+        """
+        Selects the partitions a search has to scan.
+
+        The `collection` key of the metadata filter selects partitions just like `collections` does, so it
+        is removed from the filter applied to the documents. Unknown collections are ignored.
+
+        Args:
+            collections (list, optional): Collections to search. All collections are searched when not given.
+            metadata_filter (dict, optional): Metadata the returned documents must match.
+
+        Returns:
+            tuple: The partitions to search and the remaining metadata filter.
+        """
+        metadata_filter = dict(metadata_filter or {})
+        selected = set(collections) if collections else None
+        if "collection" in metadata_filter:
+            filter_value = metadata_filter.pop("collection")
+            filter_collections = set(filter_value if isinstance(filter_value, list) else [filter_value])
+            selected = filter_collections if selected is None else selected & filter_collections
+
+        if selected is None:
+            partitions = list(self.partitions.values())
+        else:
+            unknown = selected - set(self.partitions)
+            if unknown:
+                logger.warning(f"Ignoring unknown collections: {sorted(unknown)}")
+            partitions = [self.partitions[name] for name in sorted(selected) if name in self.partitions]
+        return partitions, metadata_filter or None
+
+    def search(self, query: str, k: int = 4, collections: Optional[List[str]] = None, metadata_filter: Optional[dict] = None):
+        """
+        Embeds the query once and searches the selected collections, merging their results.
+
+        Args:
+            query (str): The query string to search for.
+            k (int): Number of documents to return.
+            collections (list, optional): Collections to search. All collections are searched when not given.
+            metadata_filter (dict, optional): Metadata the returned documents must match.
+
+        Returns:
+            list: (document, distance) pairs sorted by increasing distance.
+        """
+        partitions, metadata_filter = self.resolve_partitions(collections, metadata_filter)
+        if not partitions:
+            return []
+        vector = self.query_embeddings.embed_query(query)
+        return self._search_partitions(partitions, vector, k, metadata_filter)
+
+    def search_by_vector(self, vector, k: int = 4, collections: Optional[List[str]] = None, metadata_filter: Optional[dict] = None):
+        """
+        Searches the selected collections with an already embedded query, merging their results.
+
+        Args:
+            vector (list): The query embedding.
+            k (int): Number of documents to return.
+            collections (list, optional): Collections to search. All collections are searched when not given.
+            metadata_filter (dict, optional): Metadata the returned documents must match.
+
+        Returns:
+            list: (document, distance) pairs sorted by increasing distance.
+        """
+        partitions, metadata_filter = self.resolve_partitions(collections, metadata_filter)
+        return self._search_partitions(partitions, vector, k, metadata_filter)
+
+    @staticmethod
+    def _search_partitions(partitions, vector, k: int, metadata_filter: Optional[dict]):
+        """
+        Searches every partition for the k closest documents and keeps the k closest overall.
+        """
+        results = []
+        for partition in partitions:
+            results.extend(partition.search_by_vector(vector, k=k, metadata_filter=metadata_filter))
+        results.sort(key=lambda result: result[1])
+        return results[:k]
+
+    def query_faiss(self, query: str, collections: Optional[List[str]] = None, metadata_filter: Optional[dict] = None, k: int = 5):
         """
         Queries the Faiss index with a given query string.
 
         Args:
             query (str): The query string to search for.
+            collections (list, optional): Collections to search. All collections are searched when not given.
+            metadata_filter (dict, optional): Metadata the returned documents must match.
+            k (int): Number of documents to return.
 
         Returns:
-            list: List of results containing the closest matching documents.
+            list: List of results containing the closest matching documents, with their squared L2
+                  distance and their score (see `distance_to_score`).
 
         Raises:
             HTTPException: If the Faiss index is empty or there is an error during the query.
         """
         try:
-            if not self.vector_store:
+            if not self.partitions:
                 raise HTTPException(status_code=400, detail="Faiss index is empty. Please index documents first.")
 
-            results = self.vector_store.similarity_search(query, k=5)
+            results = self.search(query, k=k, collections=collections, metadata_filter=metadata_filter)
 
             # Return the closest matching documents along with their metadata
-            return [{"document": doc, "distance": dist, "metadata": doc.metadata} for doc, dist in results]
+            return [{"document": doc, "distance": dist, "score": distance_to_score(dist), "metadata": doc.metadata} for doc, dist in results]
 
         except Exception as e:
             logger.error(f"Error querying Faiss: {str(e)}")
             raise HTTPException(status_code=500, detail=f"Error querying Faiss: {str(e)}")
 
-    def as_retriever(self):
+    def as_retriever(self, collections: Optional[List[str]] = None, metadata_filter: Optional[dict] = None):
         """
         Returns the Faiss index as a retriever for document retrieval.
 
+        Args:
+            collections (list, optional): Collections to search. All collections are searched when not given.
+            metadata_filter (dict, optional): Metadata the returned documents must match.
+
         Returns:
             object: The Faiss retriever instance.
         """
-        return self.vector_store.as_retriever()
+        return PartitionedRetriever(indexer=self, collections=collections, metadata_filter=metadata_filter)
@@ -0,0 +1,227 @@
+import io
+import json
+import os
+import re
+import tarfile
+import zipfile
+from typing import Iterator, Optional
+
+from bs4 import BeautifulSoup
+from fastapi import HTTPException
+from langchain_core.documents import Document
+from common.logger import logger
+
+
+class BulkDocumentLoader:
+    """
+    Streams documents from a local snapshot so they can be indexed without hitting the website.
+
+    Supported sources:
+        - A directory of HTML/Markdown files (e.g. a mirrored copy of the handbook).
+        - A tar (optionally compressed) or zip archive of HTML/Markdown files.
+        - A JSONL export where every line is a JSON object describing one document.
+
+    Documents are yielded one at a time so that callers can group them into large indexing
+    batches without holding the whole snapshot in memory.
+    """
+
+    HTML_EXTENSIONS = (".html", ".htm")
+    MARKDOWN_EXTENSIONS = (".md", ".markdown")
+    JSONL_EXTENSIONS = (".jsonl", ".ndjson")
+
+    # Tags that never hold page content and would only add noise to the embeddings
+    NOISE_TAGS = ["script", "style", "noscript", "nav", "header", "footer"]
+
+    def __init__(self, path: str, base_url: Optional[str] = None):
+        """
+        Initializes the BulkDocumentLoader class.
+
+        Args:
+            path (str): Path to a directory, a tar/zip archive or a JSONL file.
+            base_url (str, optional): URL the snapshot was mirrored from. When set, the relative path of
+                                      every file is joined to it to rebuild the original page URL, which
+                                      is stored as the document source.
+        """
+        self.path = path
+        self.base_url = base_url
+
+    def lazy_load(self) -> Iterator[Document]:
+        """
+        Lazily loads the documents from the configured path.
+
+        Yields:
+            Document: One document per HTML/Markdown file or JSONL record.
+
+        Raises:
+            HTTPException: If the path does not exist or its format is not supported.
+        """
+        if not os.path.exists(self.path):
+            raise HTTPException(status_code=400, detail=f"Path not found: {self.path}")
+
+        lower_path = self.path.lower()
+        if os.path.isdir(self.path):
+            logger.info(f"Loading documents from directory {self.path}")
+            yield from self._load_directory()
+        elif lower_path.endswith(self.JSONL_EXTENSIONS):
+            logger.info(f"Loading documents from JSONL export {self.path}")
+            with open(self.path, "r", encoding="utf-8") as jsonl_file:
+                yield from self._load_jsonl(jsonl_file)
+        elif zipfile.is_zipfile(self.path):
+            logger.info(f"Loading documents from zip archive {self.path}")
+            yield from self._load_zip()
+        elif tarfile.is_tarfile(self.path):
+            logger.info(f"Loading documents from tar archive {self.path}")
+            yield from self._load_tar()
+        else:
+            raise HTTPException(status_code=400, detail=f"Unsupported bulk ingestion source: {self.path}")
+
+    def _load_directory(self) -> Iterator[Document]:
+        """
+        Walks the directory in a stable order and yields a document for every supported file.
+        Symbolic links pointing outside the directory are skipped.
+        """
+        directory = os.path.realpath(self.path)
+        for root, dirs, files in os.walk(self.path):
+            dirs.sort()
+            for file_name in sorted(files):
+                file_path = os.path.join(root, file_name)
+                relative_path = os.path.relpath(file_path, self.path).replace(os.sep, "/")
+                if not self._is_supported(relative_path):
+                    continue
+                if os.path.commonpath([directory, os.path.realpath(file_path)]) != directory:
+                    logger.warning(f"Skipping {relative_path}, which links outside {self.path}")
+                    continue
+                with open(file_path, "rb") as file:
+                    document = self._parse_file(relative_path, file.read())
+                if document:
+                    yield document
+
+    def _load_tar(self) -> Iterator[Document]:
+        """
+        Streams the members of a tar archive and yields a document for every supported file.
+        """
+        with tarfile.open(self.path, mode="r:*") as archive:
+            for member in archive:
+                if not member.isfile() or not self._is_supported(member.name):
+                    continue
+                file = archive.extractfile(member)
+                if file is None:
+                    continue
+                document = self._parse_file(member.name, file.read())
+                if document:
+                    yield document
+
+    def _load_zip(self) -> Iterator[Document]:
+        """
+        Reads the members of a zip archive and yields a document for every supported file.
+        """
+        with zipfile.ZipFile(self.path) as archive:
+            for name in sorted(archive.namelist()):
+                if name.endswith("/") or not self._is_supported(name):
+                    continue
+                document = self._parse_file(name, archive.read(name))
+                if document:
+                    yield document
+
+    def _load_jsonl(self, jsonl_file: io.TextIOBase) -> Iterator[Document]:
+        """
+        Yields a document for every valid record of a JSONL export.
+
+        Each record must hold the text in `page_content`, `content` or `text`. The optional `metadata`
+        object is kept as-is, and top-level `source`/`url` and `title` fields are copied into it.
+        """
+        for line_number, line in enumerate(jsonl_file, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                logger.warning(f"Skipping invalid JSON on line {line_number} of {self.path}: {str(e)}")
+                continue
+
+            text = record.get("page_content") or record.get("content") or record.get("text")
+            if not text:
+                logger.warning(f"Skipping record without content on line {line_number} of {self.path}")
+                continue
+
+            metadata = dict(record.get("metadata") or {})
+            source = record.get("source") or record.get("url")
+            if source:
+                metadata["source"] = source
+            if record.get("title"):
+                metadata["title"] = record["title"]
+            metadata.setdefault("source", f"{os.path.basename(self.path)}#{line_number}")
+            yield Document(page_content=text, metadata=metadata)
+
+    def _is_supported(self, name: str) -> bool:
+        """
+        Checks whether a file name has one of the supported HTML/Markdown extensions.
+        """
+        return name.lower().endswith(self.HTML_EXTENSIONS + self.MARKDOWN_EXTENSIONS)
+
+    def _parse_file(self, relative_path: str, raw_content: bytes) -> Optional[Document]:
+        """
+        Converts the raw bytes of an HTML/Markdown file into a document.
+
+        Args:
+            relative_path (str): Path of the file inside the snapshot.
+            raw_content (bytes): Raw file content.
+
+        Returns:
+            Document: The parsed document, or None if the file holds no text.
+        """
+        content = raw_content.decode("utf-8", errors="replace")
+        if relative_path.lower().endswith(self.HTML_EXTENSIONS):
+            text, title = self._parse_html(content)
+        else:
+            text, title = self._parse_markdown(content)
+
+        if not text:
+            logger.warning(f"Skipping empty document {relative_path}")
+            return None
+
+        metadata = {"source": self._source_for(relative_path)}
+        if title:
+            metadata["title"] = title
+        return Document(page_content=text, metadata=metadata)
+
+    def _parse_html(self, content: str):
+        """
+        Extracts the visible text and the title of an HTML page.
+        """
+        soup = BeautifulSoup(content, "html.parser")
+        title = soup.title.get_text(strip=True) if soup.title else None
+        for tag in soup(self.NOISE_TAGS):
+            tag.decompose()
+        text = soup.get_text(separator="\n")
+        return self._normalize_text(text), title
+
+    def _parse_markdown(self, content: str):
+        """
+        Returns the Markdown text as-is along with its first top-level heading as title.
+        """
+        match = re.search(r"^#\s+(.+)$", content, flags=re.MULTILINE)
+        title = match.group(1).strip() if match else None
+        return self._normalize_text(content), title
+
+    @staticmethod
+    def _normalize_text(text: str) -> str:
+        """
+        Strips trailing whitespace from every line and collapses runs of blank lines.
+        """
+        lines = [line.rstrip() for line in text.splitlines()]
+        return re.sub(r"\n{3,}", "\n\n", "\n".join(lines)).strip()
+
+    def _source_for(self, relative_path: str) -> str:
+        """
+        Builds the source of a file, rebuilding the page URL when a base URL is configured.
+        """
+        relative_path = re.sub(r"^(\./)+", "", relative_path)
+        if not self.base_url:
+            return relative_path
+        for index_name in ("index.html", "index.htm"):
+            if relative_path == index_name or relative_path.endswith("/" + index_name):
+                relative_path = relative_path[: -len(index_name)]
+                break
+        return f"{self.base_url.rstrip('/')}/{relative_path}"
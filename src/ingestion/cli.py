@@ -0,0 +1,38 @@
+import argparse
+import os
+from dotenv import load_dotenv
+# Load environment variables from a .env file
+load_dotenv()
+
+from ingestion.service import FaissIndexerService
+
+
+def main():
+    """
+    Command line entry point for bulk ingestion.
+
+    Usage (from the `src` directory):
+        python -m ingestion.cli <path> [--base-url URL] [--batch-size N] [--collection NAME] [--index-path PATH] [--dedup-threshold T]
+    """
+    parser = argparse.ArgumentParser(description="Bulk ingest a local directory, tar/zip archive or JSONL export into Faiss.")
+    parser.add_argument("path", help="Directory of HTML/Markdown files, tar/zip archive or JSONL export to ingest.")
+    parser.add_argument("--base-url", default=None, help="URL the snapshot was mirrored from, used to rebuild page URLs.")
+    parser.add_argument("--batch-size", type=int, default=256, help="Number of documents embedded and indexed per batch.")
+    parser.add_argument("--collection", default="default", help="Collection to index the documents in.")
+    parser.add_argument("--index-path", default="faiss_index_file", help="Path of the Faiss index to write to.")
+    parser.add_argument("--dedup-threshold", type=float, default=None, help="Minimum similarity of near-duplicate pages, above 1 to disable the detection.")
+    args = parser.parse_args()
+
+    # The command line runs with the permissions of the operator, so it may read any of their files
+    service = FaissIndexerService(args.index_path, bulk_ingest_root=os.path.abspath(os.sep))
+    result = service.bulk_ingest(args.path, base_url=args.base_url, batch_size=args.batch_size, collection=args.collection,
+                                 dedup_threshold=args.dedup_threshold)
+    print(result["message"])
+    print(f"Documents: {result['documents']}, batches: {result['batches']}")
+    if result["failed_batches"]:
+        print(f"Failed documents: {result['failed_documents']}, failed batches: {result['failed_batches']}")
+    print(f"Near-duplicates folded into aliases: {result['dedup']['near_duplicates']}, embedded: {result['dedup']['indexed']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,6 @@
 from fastapi import APIRouter, HTTPException, Depends
 from ingestion.service import FaissIndexerService
-from ingestion.dto import UploadUrlRequest
+from ingestion.dto import UploadUrlRequest, BulkIngestRequest, DeleteSourceRequest, CompactIndexRequest, ReshardIndexRequest
 from common.logger import logger
 router = APIRouter()
 
@@ -22,7 +22,7 @@ async def upload_url(request: UploadUrlRequest):
         HTTPException: If there is an error during the URL upload and indexing process.
     """
     try:
-        result = faiss_service.upload_url_and_index(request.url)
+        result = faiss_service.upload_url_and_index(request.url, collection=request.collection, dedup_threshold=request.dedup_threshold)
         logger.info(f"{request.url} uploaded successfully!")
         return result
     except HTTPException as e:
@@ -31,3 +31,110 @@ async def upload_url(request: UploadUrlRequest):
     except Exception as e:
         logger.error(e)
         raise HTTPException(status_code=500, detail=f"Failed to upload and index the URL: {str(e)}")
+
+@router.post("/bulk")
+def bulk_ingest(request: BulkIngestRequest):
+    """
+    Endpoint to stream documents from a local directory, archive or JSONL export into Faiss.
+
+    Args:
+        request (BulkIngestRequest): The snapshot location and batching options.
+
+    Returns:
+        dict: A message along with the number of documents and batches indexed, and of those that failed.
+
+    Raises:
+        HTTPException: If there is an error while reading the snapshot or no batch could be indexed.
+    """
+    try:
+        result = faiss_service.bulk_ingest(request.path, base_url=request.base_url, batch_size=request.batch_size, collection=request.collection,
+                                           dedup_threshold=request.dedup_threshold)
+        logger.info(result["message"])
+        return result
+    except HTTPException as e:
+        logger.error(e)
+        raise e
+    except Exception as e:
+        logger.error(e)
+        raise HTTPException(status_code=500, detail=f"Failed to bulk ingest {request.path}: {str(e)}")
+
+@router.post("/delete")
+def delete_source(request: DeleteSourceRequest):
+    """
+    Endpoint to delete all the documents indexed for a source URL.
+
+    Args:
+        request (DeleteSourceRequest): The source URL to delete.
+
+    Returns:
+        dict: A success message along with the number of vectors deleted.
+
+    Raises:
+        HTTPException: If the source is not indexed or an error occurs during deletion.
+    """
+    try:
+        result = faiss_service.delete_source(request.source, collection=request.collection)
+        logger.info(f"{request.source} deleted successfully!")
+        return result
+    except HTTPException as e:
+        logger.error(e)
+        raise e
+    except Exception as e:
+        logger.error(e)
+        raise HTTPException(status_code=500, detail=f"Failed to delete {request.source}: {str(e)}")
+
+@router.post("/compact")
+def compact_index(request: CompactIndexRequest):
+    """
+    Endpoint to rebuild the Faiss index without its deleted vectors.
+
+    Args:
+        request (CompactIndexRequest): Whether to run the compaction in the background.
+
+    Returns:
+        dict: A status message along with the index statistics.
+
+    Raises:
+        HTTPException: If an error occurs during compaction.
+    """
+    try:
+        return faiss_service.compact_index(background=request.background)
+    except HTTPException as e:
+        logger.error(e)
+        raise e
+    except Exception as e:
+        logger.error(e)
+        raise HTTPException(status_code=500, detail=f"Failed to compact the index: {str(e)}")
+
+@router.post("/reshard")
+def reshard_index(request: ReshardIndexRequest):
+    """
+    Endpoint to change the number of shards of the Faiss index and rebalance its vectors.
+
+    Args:
+        request (ReshardIndexRequest): The new number of shards.
+
+    Returns:
+        dict: A status message along with the number of vectors moved and the index statistics.
+
+    Raises:
+        HTTPException: If the number of shards is invalid or an error occurs while resharding.
+    """
+    try:
+        return faiss_service.reshard_index(request.shards)
+    except HTTPException as e:
+        logger.error(e)
+        raise e
+    except Exception as e:
+        logger.error(e)
+        raise HTTPException(status_code=500, detail=f"Failed to reshard the index: {str(e)}")
+
+@router.get("/stats")
+def index_stats():
+    """
+    Endpoint to report the live and dead vector statistics of the Faiss index, overall and per collection.
+
+    Returns:
+        dict: The index statistics.
+    """
+    return faiss_service.get_index_stats()
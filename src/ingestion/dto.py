@@ -1,4 +1,5 @@
 # dto.py
+from typing import Optional
 from pydantic import BaseModel
 
 class UploadUrlRequest(BaseModel):
@@ -10,5 +11,62 @@ class UploadUrlRequest(BaseModel):
 
     Attributes:
         url (str): The URL to fetch and index.
+        collection (str): The collection to index the documents in.
+        dedup_threshold (float, optional): Minimum similarity of near-duplicate pages, above 1 to disable the detection.
     """
     url: str
+    collection: str = "default"
+    dedup_threshold: Optional[float] = None
+
+
+class BulkIngestRequest(BaseModel):
+    """
+    Pydantic model for bulk ingestion.
+
+    This model is used to validate the location of a local snapshot (a directory of HTML/Markdown
+    files, a tar/zip archive or a JSONL export) that is streamed into Faiss in large batches.
+
+    Attributes:
+        path (str): Path to the snapshot on the server, inside `BULK_INGEST_ROOT` or relative to it.
+        base_url (str, optional): URL the snapshot was mirrored from, used to rebuild page URLs.
+        batch_size (int): Number of documents embedded and indexed per batch.
+        collection (str): The collection to index the documents in.
+        dedup_threshold (float, optional): Minimum similarity of near-duplicate pages, above 1 to disable the detection.
+    """
+    path: str
+    base_url: Optional[str] = None
+    batch_size: int = 256
+    collection: str = "default"
+    dedup_threshold: Optional[float] = None
+
+
+class DeleteSourceRequest(BaseModel):
+    """
+    Pydantic model for deleting the documents of a source.
+
+    Attributes:
+        source (str): The source URL whose documents should be removed from Faiss.
+        collection (str, optional): The collection to delete from. All collections are searched when not set.
+    """
+    source: str
+    collection: Optional[str] = None
+
+
+class CompactIndexRequest(BaseModel):
+    """
+    Pydantic model for compacting the Faiss index.
+
+    Attributes:
+        background (bool): Whether to run the compaction in a background thread.
+    """
+    background: bool = True
+
+
+class ReshardIndexRequest(BaseModel):
+    """
+    Pydantic model for changing the number of shards of the Faiss index.
+
+    Attributes:
+        shards (int): The number of shard worker processes every collection is spread across.
+    """
+    shards: int
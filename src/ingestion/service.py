@@ -1,7 +1,9 @@
+import os
 import requests
 import xml.etree.ElementTree as ET
 from fastapi import HTTPException
 from common.vector_db import FaissIndexer
+from ingestion.bulk_loader import BulkDocumentLoader
 from common.logger import logger
 
 class FaissIndexerService:
@@ -10,14 +12,17 @@ class FaissIndexerService:
     and indexing documents in Faiss.
     """
 
-    def __init__(self, faiss_index_file_path: str = "faiss_index_file.index"):
+    def __init__(self, faiss_index_file_path: str = "faiss_index_file.index", bulk_ingest_root: str = None):
         """
         Initializes the FaissIndexerService class.
 
         Args:
             faiss_index_file_path (str): Path to the Faiss index file.
+            bulk_ingest_root (str, optional): Folder bulk ingestion may read snapshots from. Defaults to
+                                              `BULK_INGEST_ROOT`; without it, bulk ingestion is disabled.
         """
         self.faiss_indexer = FaissIndexer(faiss_index_file_path)
+        self.bulk_ingest_root = bulk_ingest_root or os.getenv("BULK_INGEST_ROOT")
         logger.info(f"FaissIndexerService initialized with index file at {faiss_index_file_path}")
 
     def is_sitemap(self, url: str) -> bool:
@@ -86,23 +91,36 @@ class FaissIndexerService:
             raise HTTPException(status_code=500, detail="An unexpected error occurred.")
 
 
-    def upload_url_and_index(self, url: str):
+    @staticmethod
+    def _add_dedup_stats(crawl_stats: dict, result: dict):
+        """
+        Adds the near-duplicate counts of an indexing call to the stats of a crawl.
+        """
+        for key in ("documents", "indexed", "near_duplicates"):
+            crawl_stats[key] += result[key]
+        crawl_stats["embeddings_saved_ratio"] = crawl_stats["near_duplicates"] / crawl_stats["documents"] if crawl_stats["documents"] else 0.0
+
+    def upload_url_and_index(self, url: str, collection: str = "default", dedup_threshold: float = None):
         """
         Fetches content from the given URL and indexes the documents in the Faiss index.
+        Documents previously indexed for the same URL are replaced, so re-ingesting a page updates it.
 
         If the URL is a sitemap, it fetches all URLs in the sitemap and processes them one by one.
 
         Args:
             url (str): URL to fetch content from.
+            collection (str): Collection to index the documents in.
+            dedup_threshold (float, optional): Minimum similarity of near-duplicate pages. Defaults to `DEDUP_THRESHOLD`.
 
         Returns:
-            dict: A message indicating the success of the operation.
+            dict: A message indicating the success of the operation, along with the near-duplicate stats of the crawl.
         
         Raises:
             HTTPException: If an error occurs during fetching or indexing.
         """
         try:
             logger.info(f"Processing URL: {url}")
+            dedup_stats = {"documents": 0, "indexed": 0, "near_duplicates": 0, "embeddings_saved_ratio": 0.0}
             # If the URL is a sitemap, process all URLs in the sitemap
             if self.is_sitemap(url):
                 logger.info(f"Processing sitemap: {url}")
@@ -112,19 +130,184 @@ class FaissIndexerService:
                     # Fetch the content from each URL in the sitemap
                     documents = self.faiss_indexer.fetch_url_content(sitemap_url)
                     # Index the documents
-                    self.faiss_indexer.index_documents(documents)
-                logger.info(f"Successfully indexed documents from sitemap {url}")
-                return {"message": f"Successfully indexed documents from sitemap {url}"}
+                    result = self.faiss_indexer.index_documents(documents, replace=True, collection=collection, dedup_threshold=dedup_threshold)
+                    self._add_dedup_stats(dedup_stats, result)
+                logger.info(f"Successfully indexed documents from sitemap {url} (dedup: {dedup_stats})")
+                return {"message": f"Successfully indexed documents from sitemap {url}", "dedup": dedup_stats}
             else:
                 # If the URL is not a sitemap, process it normally
                 logger.info(f"Processing regular URL: {url}")
                 documents = self.faiss_indexer.fetch_url_content(url)
-                self.faiss_indexer.index_documents(documents)
-                logger.info(f"Successfully indexed documents from {url}")
-                return {"message": f"Successfully indexed documents from {url}"}
+                result = self.faiss_indexer.index_documents(documents, replace=True, collection=collection, dedup_threshold=dedup_threshold)
+                self._add_dedup_stats(dedup_stats, result)
+                logger.info(f"Successfully indexed documents from {url} (dedup: {dedup_stats})")
+                return {"message": f"Successfully indexed documents from {url}", "dedup": dedup_stats}
         except HTTPException as e:
             logger.error(f"HTTP error occurred while processing URL {url}: {str(e.detail)}")
             raise e
         except Exception as e:
             logger.error(f"An error occurred while uploading and indexing the URL {url}: {str(e)}")
             raise HTTPException(status_code=500, detail=f"An error occurred while uploading and indexing the URL: {str(e)}")
+
+    def _resolve_bulk_path(self, path: str) -> str:
+        """
+        Resolves a bulk ingestion path against the bulk ingestion root, following symbolic links.
+
+        Args:
+            path (str): Path to the snapshot, absolute or relative to the root.
+
+        Returns:
+            str: The resolved path.
+
+        Raises:
+            HTTPException: If bulk ingestion is disabled or the path resolves outside the root.
+        """
+        if not self.bulk_ingest_root:
+            raise HTTPException(status_code=403, detail="Bulk ingestion is disabled, set BULK_INGEST_ROOT to enable it.")
+        root = os.path.realpath(self.bulk_ingest_root)
+        resolved = os.path.realpath(os.path.join(root, path))
+        if os.path.commonpath([root, resolved]) != root:
+            raise HTTPException(status_code=403, detail=f"Path is outside the bulk ingestion root: {path}")
+        return resolved
+
+    def bulk_ingest(self, path: str, base_url: str = None, batch_size: int = 256, collection: str = "default",
+                    dedup_threshold: float = None):
+        """
+        Streams documents from a local directory, archive or JSONL export and indexes them in batches.
+
+        The index is only saved once after the last batch, which keeps full rebuilds from a mirrored
+        snapshot fast and avoids rewriting the index file for every document. A batch that fails to be
+        indexed is skipped and reported, and the remaining batches are still indexed.
+
+        Only paths inside the bulk ingestion root are read, so the endpoint cannot be used to read
+        arbitrary files of the server.
+
+        Args:
+            path (str): Path to a directory of HTML/Markdown files, a tar/zip archive or a JSONL export,
+                        absolute or relative to the bulk ingestion root.
+            base_url (str, optional): URL the snapshot was mirrored from, used to rebuild page URLs.
+            batch_size (int): Number of documents embedded and indexed per batch.
+            collection (str): Collection to index the documents in.
+            dedup_threshold (float, optional): Minimum similarity of near-duplicate pages. Defaults to `DEDUP_THRESHOLD`.
+
+        Returns:
+            dict: A message along with the number of documents and batches indexed, the number of documents
+                  and batches that failed and the near-duplicate stats.
+
+        Raises:
+            HTTPException: If the path is outside the bulk ingestion root, the source cannot be read, or if
+                           no batch could be indexed.
+        """
+        if batch_size < 1:
+            raise HTTPException(status_code=400, detail="batch_size must be a positive integer.")
+        path = self._resolve_bulk_path(path)
+        try:
+            logger.info(f"Bulk ingesting documents from {path} in batches of {batch_size}")
+            loader = BulkDocumentLoader(path, base_url=base_url)
+            counts = {"documents": 0, "batches": 0, "failed_documents": 0, "failed_batches": 0}
+            dedup_stats = {"documents": 0, "indexed": 0, "near_duplicates": 0, "embeddings_saved_ratio": 0.0}
+            # Every source is replaced once, before its first batch, so its later chunks do not delete the earlier ones
+            replaced_sources = set()
+            errors = []
+
+            def index_batch(batch):
+                try:
+                    result = self.faiss_indexer.index_documents(batch, save=False, replace=True, collection=collection,
+                                                                dedup_threshold=dedup_threshold, replaced_sources=replaced_sources)
+                except HTTPException as e:
+                    counts["failed_documents"] += len(batch)
+                    counts["failed_batches"] += 1
+                    errors.append(e.detail)
+                    logger.error(f"Failed to index batch {counts['batches'] + counts['failed_batches']} of {path}: {e.detail}")
+                    return
+                self._add_dedup_stats(dedup_stats, result)
+                counts["documents"] += result["documents"]
+                counts["batches"] += 1
+                logger.info(f"Indexed batch {counts['batches'] + counts['failed_batches']} ({counts['documents']} documents so far)")
+
+            batch = []
+            for document in loader.lazy_load():
+                batch.append(document)
+                if len(batch) >= batch_size:
+                    index_batch(batch)
+                    batch = []
+            if batch:
+                index_batch(batch)
+
+            if counts["failed_batches"] and not counts["batches"]:
+                raise HTTPException(status_code=500, detail=f"Failed to index any of the {counts['failed_documents']} documents from {path}: {errors[0]}")
+            self.faiss_indexer.save_faiss_index(collection)
+            if counts["failed_batches"]:
+                message = (f"Partially indexed documents from {path}: {counts['failed_batches']} of "
+                           f"{counts['batches'] + counts['failed_batches']} batches failed ({errors[0]})")
+                logger.warning(f"{message} (dedup: {dedup_stats})")
+            else:
+                message = f"Successfully indexed documents from {path}"
+                logger.info(f"Successfully bulk indexed {counts['documents']} documents from {path} (dedup: {dedup_stats})")
+            return {"message": message, **counts, "dedup": dedup_stats}
+        except HTTPException as e:
+            logger.error(f"HTTP error occurred while bulk ingesting {path}: {str(e.detail)}")
+            raise e
+        except Exception as e:
+            logger.error(f"An error occurred while bulk ingesting {path}: {str(e)}")
+            raise HTTPException(status_code=500, detail=f"An error occurred while bulk ingesting: {str(e)}")
+
+    def delete_source(self, source: str, collection: str = None):
+        """
+        Deletes all the documents indexed for a source URL.
+
+        Args:
+            source (str): The source URL to delete.
+            collection (str, optional): Collection to delete from. All collections are searched when not given.
+
+        Returns:
+            dict: A message along with the number of vectors deleted.
+
+        Raises:
+            HTTPException: If the source is not present in the index.
+        """
+        deleted = self.faiss_indexer.delete_by_source(source, collection=collection)
+        if not deleted:
+            raise HTTPException(status_code=404, detail=f"No documents indexed for source {source}")
+        logger.info(f"Deleted {deleted} vectors for source {source}")
+        return {"message": f"Successfully deleted documents for source {source}", "deleted_vectors": deleted}
+
+    def compact_index(self, background: bool = True):
+        """
+        Rebuilds the Faiss index without the deleted vectors.
+
+        Args:
+            background (bool): Whether to run the compaction in a background thread.
+
+        Returns:
+            dict: A message along with the index statistics.
+        """
+        if background:
+            started = self.faiss_indexer.compact_in_background()
+            message = "Compaction started in the background." if started else "A compaction is already running."
+            return {"message": message, "stats": self.faiss_indexer.get_index_stats()}
+        stats = self.faiss_indexer.compact()
+        return {"message": "Compaction completed.", "stats": stats}
+
+    def reshard_index(self, shards: int):
+        """
+        Spreads every collection of the Faiss index across the given number of shard worker processes.
+
+        Args:
+            shards (int): The new number of shards.
+
+        Returns:
+            dict: A message along with the number of vectors moved and the index statistics.
+        """
+        result = self.faiss_indexer.reshard(shards)
+        moved = result.pop("moved_vectors")
+        return {"message": f"Index resharded to {shards} shards, {moved} vectors moved.", "moved_vectors": moved, "stats": result}
+
+    def get_index_stats(self):
+        """
+        Returns the live and dead vector statistics of the Faiss index, overall and per collection.
+
+        Returns:
+            dict: The index statistics.
+        """
+        return self.faiss_indexer.get_index_stats()
@@ -9,6 +9,7 @@ import uvicorn
 from common.vector_db import FaissIndexer  # Import FaissIndexer class from vector_db.py
 from ingestion.router import router as api_router
 from synthAI.router import router as instructai_router
+from search.router import router as search_router
 
 
 
@@ -18,6 +19,7 @@ app = FastAPI()
 # Include routers for different APIs
 app.include_router(api_router)
 app.include_router(instructai_router)
+app.include_router(search_router)
 
 # Initialize the FaissIndexer instance with the specified file path for Faiss index
 faiss_indexer = FaissIndexer(faiss_index_file_path="faiss_index_file")
@@ -0,0 +1,41 @@
+from fastapi import APIRouter, HTTPException
+from search.service import SearchService
+from search.dto import SearchRequest
+from common.logger import logger
+router = APIRouter()
+
+# Create an instance of the SearchService
+search_service = SearchService()
+
+@router.post("")
+def search(request: SearchRequest):
+    """
+    Endpoint returning the scored handbook pages matching a query, without generating an answer.
+
+    Args:
+        request (SearchRequest): The query, the collections and filter to search and the cutoff options.
+
+    Returns:
+        dict: The hits with their score, source, title and snippet, and the search timings.
+
+    Raises:
+        HTTPException: If the cutoff options are invalid or an error occurs while searching.
+    """
+    try:
+        return search_service.search(request)
+    except HTTPException as e:
+        logger.error(e)
+        raise e
+    except Exception as e:
+        logger.error(e)
+        raise HTTPException(status_code=500, detail=f"Failed to search: {str(e)}")
+
+@router.get("/stats")
+def search_stats():
+    """
+    Endpoint reporting the p50 and p99 latencies of the query embedding and of the index search.
+
+    Returns:
+        dict: The search latency statistics.
+    """
+    return search_service.get_stats()
@@ -0,0 +1,24 @@
+from typing import List, Optional
+from pydantic import BaseModel
+
+class SearchRequest(BaseModel):
+    """
+    Pydantic model for a retrieval-only search.
+
+    The number of hits adapts to the query: hits scoring below `min_score` are dropped, and the list is
+    cut at the first drop in score larger than `max_score_gap`, up to `max_k` hits.
+
+    Attributes:
+        query (str): The search query.
+        collections (list, optional): Collections to search. All collections are searched when not set.
+        filter (dict, optional): Metadata the hits must match.
+        max_k (int, optional): Largest number of hits. Defaults to `SEARCH_MAX_K`.
+        min_score (float, optional): Lowest score of a hit. Defaults to `SEARCH_MIN_SCORE`.
+        max_score_gap (float, optional): Largest score drop between consecutive hits. Defaults to `SEARCH_MAX_SCORE_GAP`.
+    """
+    query: str
+    collections: Optional[List[str]] = None
+    filter: Optional[dict] = None
+    max_k: Optional[int] = None
+    min_score: Optional[float] = None
+    max_score_gap: Optional[float] = None
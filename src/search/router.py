@@ -0,0 +1,8 @@
+from fastapi import APIRouter, Depends
+from search.controller import router as search_controller
+from common.auth import api_key_dependency
+
+router = APIRouter()
+
+# Include the controller with routes
+router.include_router(search_controller, prefix="/search", tags=["Search"], dependencies=[Depends(api_key_dependency)])
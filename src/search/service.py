@@ -0,0 +1,149 @@
+import os
+import re
+import threading
+import time
+from collections import deque
+import numpy as np
+from fastapi import HTTPException
+from common.vector_db import FaissIndexer, distance_to_score
+from search.dto import SearchRequest
+from common.logger import logger
+
+# Length of the snippet returned with every hit, in characters
+SNIPPET_LENGTH = 300
+
+_QUERY_TERM_PATTERN = re.compile(r"\w{4,}")
+
+
+class SearchService:
+    """
+    Retrieval-only search over the Faiss index: returns scored handbook links without any LLM call.
+
+    The score of a hit is the cosine similarity of its embedding with the query. Instead of a fixed k,
+    hits are kept while they score above a minimum and until the first large drop in score, so a
+    precise query returns its one or two pages and a broad one returns more.
+    """
+
+    def __init__(self):
+        """
+        Initializes the SearchService class.
+
+        Attributes:
+            faiss_indexer (FaissIndexer): The Faiss indexer to search.
+            max_k (int): Default largest number of hits, from `SEARCH_MAX_K` or 10.
+            min_score (float): Default lowest score of a hit, from `SEARCH_MIN_SCORE` or 0.5.
+            max_score_gap (float): Default largest score drop between consecutive hits, from `SEARCH_MAX_SCORE_GAP` or 0.05.
+        """
+        self.faiss_indexer = FaissIndexer()
+        self.max_k = int(os.getenv("SEARCH_MAX_K", 10))
+        self.min_score = float(os.getenv("SEARCH_MIN_SCORE", 0.5))
+        self.max_score_gap = float(os.getenv("SEARCH_MAX_SCORE_GAP", 0.05))
+        self._lock = threading.Lock()
+        # Embedding and index search latencies of the last searches, in milliseconds
+        self._latencies = deque(maxlen=int(os.getenv("SEARCH_LATENCY_WINDOW", 1000)))
+
+    @staticmethod
+    def cut_hits(results, min_score: float, max_score_gap: float):
+        """
+        Keeps the hits scoring at least `min_score`, up to the first score drop larger than `max_score_gap`.
+
+        Args:
+            results (list): (document, distance) pairs sorted by increasing distance.
+            min_score (float): Lowest score of a hit.
+            max_score_gap (float): Largest score drop between consecutive hits.
+
+        Returns:
+            list: The (document, score) pairs kept.
+        """
+        hits = []
+        for document, distance in results:
+            score = distance_to_score(distance)
+            if score < min_score or (hits and hits[-1][1] - score > max_score_gap):
+                break
+            hits.append((document, score))
+        return hits
+
+    @staticmethod
+    def snippet(text: str, query: str) -> str:
+        """
+        Returns an excerpt of a document, starting shortly before the first query term it contains.
+        """
+        text = " ".join(text.split())
+        lowered = text.lower()
+        positions = [lowered.find(term) for term in _QUERY_TERM_PATTERN.findall(query.lower())]
+        positions = [position for position in positions if position >= 0]
+        start = max(0, min(positions) - SNIPPET_LENGTH // 4) if positions else 0
+        if start:
+            # Start on a word boundary
+            start = text.find(" ", start) + 1 or start
+        excerpt = text[start:start + SNIPPET_LENGTH]
+        return ("..." if start else "") + excerpt + ("..." if start + SNIPPET_LENGTH < len(text) else "")
+
+    def search(self, request: SearchRequest) -> dict:
+        """
+        Searches the Faiss index and returns the scored hits of the query.
+
+        Args:
+            request (SearchRequest): The query, the collections and filter to search and the cutoff options.
+
+        Returns:
+            dict: The hits with their score, source, title, snippet, collection and aliases, along with the
+                  time spent embedding the query and searching the index.
+
+        Raises:
+            HTTPException: If the cutoff options are invalid or an error occurs while searching.
+        """
+        max_k = request.max_k if request.max_k is not None else self.max_k
+        if max_k < 1:
+            raise HTTPException(status_code=400, detail="max_k must be a positive integer.")
+        min_score = request.min_score if request.min_score is not None else self.min_score
+        max_score_gap = request.max_score_gap if request.max_score_gap is not None else self.max_score_gap
+        try:
+            start = time.perf_counter()
+            vector = self.faiss_indexer.query_embeddings.embed_query(request.query)
+            embedded = time.perf_counter()
+            results = self.faiss_indexer.search_by_vector(vector, k=max_k, collections=request.collections, metadata_filter=request.filter)
+            hits = self.cut_hits(results, min_score, max_score_gap)
+            searched = time.perf_counter()
+        except HTTPException as e:
+            raise e
+        except Exception as e:
+            logger.error(f"Error searching for '{request.query}': {str(e)}")
+            raise HTTPException(status_code=500, detail=f"Error searching: {str(e)}")
+
+        embedding_ms = (embedded - start) * 1000
+        search_ms = (searched - embedded) * 1000
+        with self._lock:
+            self._latencies.append((embedding_ms, search_ms))
+        return {
+            "query": request.query,
+            "count": len(hits),
+            "hits": [
+                {
+                    "score": score,
+                    "source": document.metadata.get("source"),
+                    "title": document.metadata.get("title") or document.metadata.get("source"),
+                    "snippet": self.snippet(document.page_content, request.query),
+                    "collection": document.metadata.get("collection"),
+                    "aliases": document.metadata.get("aliases", [])
+                }
+                for document, score in hits
+            ],
+            "timings_ms": {"embedding": embedding_ms, "search": search_ms}
+        }
+
+    def get_stats(self) -> dict:
+        """
+        Reports the latency percentiles of the last searches, split between the query embedding and the
+        index search that follows it.
+
+        Returns:
+            dict: The number of searches measured and the p50 and p99 latencies in milliseconds.
+        """
+        with self._lock:
+            latencies = np.array(self._latencies) if self._latencies else np.zeros((0, 2))
+        stats = {"searches": len(latencies)}
+        for column, name in enumerate(("embedding", "search")):
+            for percentile in (50, 99):
+                stats[f"{name}_p{percentile}_ms"] = float(np.percentile(latencies[:, column], percentile)) if len(latencies) else 0.0
+        return stats
@@ -7,7 +7,7 @@ router = APIRouter()
 instructai_service = InstructAIService()
 
 @router.post("/query")
-async def query_instructai(msg_input:MessageInput):
+def query_instructai(msg_input:MessageInput):
     """
     Endpoint for querying the InstructAI service with a user query.
 
@@ -23,3 +23,13 @@ async def query_instructai(msg_input:MessageInput):
         return {"answer": result}
     except HTTPException as e:
         raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+@router.get("/stats")
+def instructai_stats():
+    """
+    Endpoint reporting the LLM call scheduler, query embedding batcher, speculative prefetch and history compaction statistics.
+
+    Returns:
+        dict: The scheduler, embedding batcher, prefetch and history compaction statistics.
+    """
+    return instructai_service.get_stats()
@@ -1,6 +1,9 @@
+from typing import List, Optional
 from pydantic import BaseModel
 
 class MessageInput(BaseModel):
-    """The input for message"""
+    """The input for message, optionally restricted to some collections or metadata"""
     query: str
-    session_id : str
\ No newline at end of file
+    session_id : str
+    collections: Optional[List[str]] = None
+    filter: Optional[dict] = None
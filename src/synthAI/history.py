@@ -0,0 +1,143 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from common.logger import logger
+from common.tokens import count_tokens
+
+
+class HistoryCompactor:
+    """
+    Keeps the chat history sent to query reformulation bounded.
+
+    The last `recent_turns` turns of a session are sent verbatim; older turns are folded into a rolling
+    summary. The summary is updated incrementally in the background once turns leave the verbatim window,
+    at the lowest scheduler priority, so it never delays an answer. Turns that left the window but are not
+    folded into the summary yet are still sent verbatim, so nothing is lost while an update is running.
+    The verbatim messages are capped at `max_verbatim_tokens` all the same, keeping the most recent ones,
+    so the prompt stays bounded when summary updates fall behind under load.
+    """
+
+    def __init__(self, query_service, recent_turns: int = None, max_summary_words: int = None, max_workers: int = None,
+                 max_verbatim_tokens: int = None):
+        """
+        Initializes the HistoryCompactor class.
+
+        Args:
+            query_service (InstructAIQueryService): Generates the summaries.
+            recent_turns (int, optional): Turns kept verbatim. Defaults to `HISTORY_RECENT_TURNS` or 3.
+            max_summary_words (int, optional): Length limit of a summary. Defaults to `HISTORY_SUMMARY_MAX_WORDS` or 150.
+            max_workers (int, optional): Summary updates running at a time. Defaults to `HISTORY_SUMMARY_WORKERS` or 2.
+            max_verbatim_tokens (int, optional): Tokens of history sent verbatim at most. Defaults to
+                                                 `HISTORY_MAX_VERBATIM_TOKENS` or 1500.
+        """
+        self.query_service = query_service
+        self.recent_turns = recent_turns or int(os.getenv("HISTORY_RECENT_TURNS", 3))
+        self.max_summary_words = max_summary_words or int(os.getenv("HISTORY_SUMMARY_MAX_WORDS", 150))
+        self.max_verbatim_tokens = max_verbatim_tokens or int(os.getenv("HISTORY_MAX_VERBATIM_TOKENS", 1500))
+        self._executor = ThreadPoolExecutor(max_workers=max_workers or int(os.getenv("HISTORY_SUMMARY_WORKERS", 2)),
+                                            thread_name_prefix="history-summary")
+        self._lock = threading.Lock()
+        # Maps every session to its summary, the number of history messages folded into it and whether an update is running
+        self._sessions = {}
+        self._stats = {
+            "summary_updates": 0,
+            "failed": 0,
+            "messages_summarized": 0,
+            "truncated_contexts": 0,
+            "messages_truncated": 0
+        }
+
+    def get_context(self, session_id: str, history: list):
+        """
+        Returns the context to reformulate a query with.
+
+        The messages not folded into the summary are sent verbatim, cut down to the most recent ones that
+        fit in `max_verbatim_tokens`; the last message is always kept.
+
+        Args:
+            session_id (str): The session.
+            history (list): The full chat history of the session, one message per item.
+
+        Returns:
+            tuple: The summary of the earlier conversation (None if there is none yet) and the messages sent verbatim.
+        """
+        with self._lock:
+            session = self._sessions.get(session_id)
+            summary, verbatim = (None, history) if session is None else (session["summary"], history[session["summarized"]:])
+
+        start, tokens = len(verbatim), 0
+        while start > 0:
+            tokens += count_tokens(str(verbatim[start - 1]))
+            if tokens > self.max_verbatim_tokens and start < len(verbatim):
+                break
+            start -= 1
+        if start:
+            with self._lock:
+                self._stats["truncated_contexts"] += 1
+                self._stats["messages_truncated"] += start
+        return summary, verbatim[start:]
+
+    def schedule_update(self, session_id: str, history: list):
+        """
+        Starts folding the messages that left the verbatim window into the summary of the session, unless
+        an update is already running for it; that update picks up the new messages when it is done.
+
+        Args:
+            session_id (str): The session.
+            history (list): The full chat history of the session, one message per item.
+        """
+        with self._lock:
+            session = self._sessions.setdefault(session_id, {"summary": None, "summarized": 0, "updating": False})
+            if session["updating"] or self._cutoff(history) <= session["summarized"]:
+                return
+            session["updating"] = True
+        self._executor.submit(self._update, session_id, history)
+
+    def _cutoff(self, history: list) -> int:
+        """
+        Returns the number of messages before the verbatim window; every turn is a user and an AI message.
+        """
+        return max(0, len(history) - 2 * self.recent_turns)
+
+    def _update(self, session_id: str, history: list):
+        """
+        Folds the pending messages of a session into its summary until it has caught up with the history.
+        """
+        session = self._sessions[session_id]
+        try:
+            while True:
+                cutoff = self._cutoff(history)
+                with self._lock:
+                    start, summary = session["summarized"], session["summary"]
+                    if cutoff <= start:
+                        session["updating"] = False
+                        return
+                summary = self.query_service.summarize_history(summary, history[start:cutoff], self.max_summary_words)
+                with self._lock:
+                    session["summary"] = summary
+                    session["summarized"] = cutoff
+                    self._stats["summary_updates"] += 1
+                    self._stats["messages_summarized"] += cutoff - start
+        except Exception as e:
+            logger.error(f"Error updating the history summary of session {session_id}: {e}")
+            with self._lock:
+                self._stats["failed"] += 1
+                session["updating"] = False
+
+    def get_stats(self) -> dict:
+        """
+        Reports the history compaction counters.
+
+        Returns:
+            dict: The number of summary updates, failed updates and messages folded into summaries, the contexts
+                  and messages cut to the verbatim token cap, the sessions with a summary and the turns and
+                  tokens kept verbatim.
+        """
+        with self._lock:
+            return {
+                **self._stats,
+                "sessions_summarized": sum(1 for session in self._sessions.values() if session["summary"]),
+                "recent_turns": self.recent_turns,
+                "max_summary_words": self.max_summary_words,
+                "max_verbatim_tokens": self.max_verbatim_tokens
+            }
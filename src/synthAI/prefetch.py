@@ -0,0 +1,274 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from common.logger import logger
+
+
+class SpeculativePrefetcher:
+    """
+    Speculatively prepares the related queries suggested to a session, so that clicking one of them
+    returns almost instantly.
+
+    Once an answer has been sent, the retrieval of every suggested query is computed in the background.
+    Answers are limited by an explicit budget: only the first `max_answers_per_turn` suggestions of an
+    answer are answered, at most `max_calls_per_minute` times a minute overall, and only while the LLM
+    scheduler has spare capacity. Clicking a suggestion without a prefetched answer still skips the
+    retrieval. Results go into a short-lived per-session cache. The LLM calls and retrievals of entries
+    that expire or are replaced by the suggestions of a newer answer without being used are counted as
+    wasted work.
+    """
+
+    def __init__(self, scheduler, enabled: bool = None, ttl_seconds: float = None, max_workers: int = None,
+                 max_answers_per_turn: int = None, max_calls_per_minute: int = None):
+        """
+        Initializes the SpeculativePrefetcher class.
+
+        Args:
+            scheduler (LLMScheduler): The LLM scheduler, asked for spare capacity before every prefetched answer.
+            enabled (bool, optional): Whether to prefetch at all. Defaults to `SPECULATIVE_PREFETCH` or False.
+            ttl_seconds (float, optional): Lifetime of a prefetched entry. Defaults to `PREFETCH_TTL_SECONDS` or 300.
+            max_workers (int, optional): Prefetches running at a time. Defaults to `PREFETCH_MAX_WORKERS` or 2.
+            max_answers_per_turn (int, optional): Suggestions of an answer whose answer is prefetched, the
+                                                  first ones. Defaults to `PREFETCH_MAX_ANSWERS_PER_TURN` or 1.
+            max_calls_per_minute (int, optional): LLM calls prefetching may spend per minute, across all
+                                                  sessions. Defaults to `PREFETCH_MAX_CALLS_PER_MINUTE` or 20.
+        """
+        self.scheduler = scheduler
+        self.enabled = enabled if enabled is not None else os.getenv("SPECULATIVE_PREFETCH", "false").lower() == "true"
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else float(os.getenv("PREFETCH_TTL_SECONDS", 300))
+        self.max_workers = max_workers or int(os.getenv("PREFETCH_MAX_WORKERS", 2))
+        self.max_answers_per_turn = max_answers_per_turn if max_answers_per_turn is not None else int(os.getenv("PREFETCH_MAX_ANSWERS_PER_TURN", 1))
+        self.max_calls_per_minute = max_calls_per_minute if max_calls_per_minute is not None else int(os.getenv("PREFETCH_MAX_CALLS_PER_MINUTE", 20))
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="prefetch")
+        self._lock = threading.Lock()
+        self._running = 0
+        self._suggestions = {}  # Maps every session to the cache keys of its latest suggestions
+        self._cache = {}  # Maps (session, cache key) to (expires_at, entry)
+        self._jobs = {}  # Maps (session, cache key) to the future of its prefetch until it is cached
+        self._budget = deque()  # Times of the answer calls budgeted during the last minute
+        self._stats = {
+            "suggested": 0,
+            "retrieved": 0,
+            "prefetched": 0,
+            "skipped_no_budget": 0,
+            "skipped_no_capacity": 0,
+            "cancelled": 0,
+            "failed": 0,
+            "hits": 0,
+            "retrieval_hits": 0,
+            "waited": 0,
+            "misses": 0,
+            "llm_calls": 0,
+            "wasted_llm_calls": 0,
+            "wasted_retrievals": 0
+        }
+
+    @staticmethod
+    def cache_key(query: str, scope=None) -> str:
+        """
+        Builds the cache key of a query, along with the collections and filter it was searched with.
+        """
+        return json.dumps([" ".join(query.lower().split()), scope], sort_keys=True)
+
+    def schedule(self, session_id: str, queries, retrieve_fn, answer_fn, scope=None):
+        """
+        Starts prefetching the queries suggested to a session.
+
+        The unused entries prefetched for the previous suggestions of the session are dropped, and their
+        prefetches that did not start yet are cancelled; suggestions made again are kept. Every suggestion
+        is retrieved; the answer calls are reserved from the budget here, and given back if they end up
+        not being made.
+
+        Args:
+            session_id (str): The session the queries were suggested to.
+            queries (list): The suggested queries.
+            retrieve_fn (callable): Retrieves the documents of a query, without any LLM call.
+            answer_fn (callable): Answers a query from its retrieved documents, with a single LLM call.
+            scope (optional): Collections and filter the queries are searched with, part of the cache key.
+        """
+        if not self.enabled:
+            return
+        keys = [self.cache_key(query, scope) for query in queries]
+        with self._lock:
+            self._purge_expired()
+            for key in self._suggestions.pop(session_id, []):
+                if key in keys:
+                    continue
+                entry = self._cache.pop((session_id, key), None)
+                if entry is not None:
+                    self._waste(entry[1])
+                job = self._jobs.get((session_id, key))
+                if job is not None and job[0].cancel():
+                    self._cancel(session_id, key, job[1])
+            self._suggestions[session_id] = keys
+            self._stats["suggested"] += len(queries)
+
+            for number, (query, key) in enumerate(zip(queries, keys)):
+                if (session_id, key) in self._cache or (session_id, key) in self._jobs:
+                    continue
+                reservation = self._reserve_budget() if number < self.max_answers_per_turn else None
+                self._stats["skipped_no_budget"] += reservation is None
+                self._running += 1
+                # The prefetch needs the lock to start, so it is registered before it can finish
+                future = self._executor.submit(self._prefetch, session_id, key, query, retrieve_fn, answer_fn, reservation)
+                self._jobs[(session_id, key)] = (future, reservation)
+
+    def _reserve_budget(self):
+        """
+        Reserves an answer call from the per-minute budget. Must be called with the lock held.
+
+        Returns:
+            float: The time of the reservation, or None if the budget of the last minute is spent.
+        """
+        now = time.monotonic()
+        while self._budget and self._budget[0] <= now - 60:
+            self._budget.popleft()
+        if len(self._budget) >= self.max_calls_per_minute:
+            return None
+        self._budget.append(now)
+        return now
+
+    def _refund_budget(self, reservation):
+        """
+        Gives back an answer call reserved but not made. Must be called with the lock held.
+        """
+        if reservation is not None and reservation in self._budget:
+            self._budget.remove(reservation)
+
+    def _cancel(self, session_id: str, key: str, reservation):
+        """
+        Accounts for a prefetch cancelled before it started. Must be called with the lock held.
+        """
+        self._jobs.pop((session_id, key), None)
+        self._running -= 1
+        self._stats["cancelled"] += 1
+        self._refund_budget(reservation)
+
+    def _prefetch(self, session_id: str, key: str, query: str, retrieve_fn, answer_fn, reservation):
+        """
+        Retrieves the documents of a suggested query, answers it if an answer call was reserved and the
+        scheduler has spare capacity, and caches the result, unless the suggestion got stale meanwhile.
+        """
+        entry = {"results": None, "answer": None, "llm_calls": 0}
+        try:
+            if not self._is_suggested(session_id, key):
+                return
+            entry["results"] = retrieve_fn(query)
+            with self._lock:
+                self._stats["retrieved"] += 1
+            if reservation is None:
+                return
+            if self._is_suggested(session_id, key) and self.scheduler.has_spare_capacity():
+                entry["answer"] = answer_fn(query, entry["results"])
+                # The confidence gate answers without calling the model
+                entry["llm_calls"] = 0 if entry["answer"].get("low_confidence") else 1
+                with self._lock:
+                    self._stats["prefetched"] += 1
+                    self._stats["llm_calls"] += entry["llm_calls"]
+            else:
+                with self._lock:
+                    self._stats["skipped_no_capacity"] += 1
+        except Exception as e:
+            logger.error(f"Error prefetching '{query}' for session {session_id}: {e}")
+            with self._lock:
+                self._stats["failed"] += 1
+        finally:
+            with self._lock:
+                self._running -= 1
+                self._jobs.pop((session_id, key), None)
+                if not entry["llm_calls"]:
+                    self._refund_budget(reservation)
+                if entry["results"] is not None:
+                    if key in self._suggestions.get(session_id, []):
+                        self._cache[(session_id, key)] = (time.monotonic() + self.ttl_seconds, entry)
+                    else:
+                        self._waste(entry)
+
+    def _is_suggested(self, session_id: str, key: str) -> bool:
+        """
+        Whether a query is still among the latest suggestions of a session.
+        """
+        with self._lock:
+            return key in self._suggestions.get(session_id, [])
+
+    def get(self, session_id: str, query: str, scope=None):
+        """
+        Returns the prefetched entry of a query and removes it from the cache.
+
+        A query whose prefetch is running is waited for, so that its answer call is not paid for twice.
+        A prefetch that did not start yet is cancelled instead, and the query counts as a miss.
+
+        Args:
+            session_id (str): The session asking the query.
+            query (str): The query.
+            scope (optional): Collections and filter the query is searched with.
+
+        Returns:
+            dict: The retrieval `results` of the query and its `answer`, None when only the retrieval was
+                  prefetched, or None if the query was not prefetched.
+        """
+        if not self.enabled:
+            return None
+        key = self.cache_key(query, scope)
+        with self._lock:
+            self._purge_expired()
+            suggested = key in self._suggestions.get(session_id, [])
+            job = self._jobs.get((session_id, key)) if suggested else None
+            if job is not None and job[0].cancel():
+                self._cancel(session_id, key, job[1])
+                job = None
+        if job is not None:
+            job[0].result()
+
+        with self._lock:
+            entry = self._cache.pop((session_id, key), None)
+            if entry is not None:
+                self._stats["hits" if entry[1]["answer"] is not None else "retrieval_hits"] += 1
+                self._stats["waited"] += job is not None
+                return entry[1]
+            if suggested:
+                self._stats["misses"] += 1
+            return None
+
+    def _waste(self, entry: dict):
+        """
+        Counts the work spent on an entry that was never used. Must be called with the lock held.
+        """
+        self._stats["wasted_llm_calls"] += entry["llm_calls"]
+        self._stats["wasted_retrievals"] += 1
+
+    def _purge_expired(self):
+        """
+        Drops the expired entries. Must be called with the lock held.
+        """
+        now = time.monotonic()
+        for cache_key, (expires_at, entry) in list(self._cache.items()):
+            if expires_at <= now:
+                del self._cache[cache_key]
+                self._waste(entry)
+
+    def get_stats(self) -> dict:
+        """
+        Reports how useful the speculative prefetching is.
+
+        Returns:
+            dict: The number of suggestions, retrievals and answers prefetched, answers skipped for lack of
+                  budget or capacity, cancelled and failed prefetches, hits on prefetched answers and on
+                  retrievals only, hits that waited for a running prefetch, misses on suggested queries, the
+                  hit rate, the LLM calls spent and wasted, and the budget left for the current minute.
+        """
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["retrieval_hits"] + self._stats["misses"]
+            now = time.monotonic()
+            budgeted = sum(1 for reserved_at in self._budget if reserved_at > now - 60)
+            return {
+                "enabled": self.enabled,
+                **self._stats,
+                "hit_rate": self._stats["hits"] / lookups if lookups else 0.0,
+                "budget_left": max(0, self.max_calls_per_minute - budgeted),
+                "cached": len(self._cache),
+                "running": self._running
+            }
@@ -1,6 +1,10 @@
+import threading
 from common.instructai import InstructAIQueryService
+from common.llm_scheduler import CallPriority
 from fastapi import HTTPException
 from synthAI.dto import MessageInput
+from synthAI.history import HistoryCompactor
+from synthAI.prefetch import SpeculativePrefetcher
 from common.logger import logger
 
 class InstructAIService:
@@ -9,17 +13,27 @@ class InstructAIService:
     Provides methods to query the InstructAI service for generating responses and maintaining session-based history.
     """
 
-    def __init__(self):
+    def __init__(self, llm=None):
         """
         Initializes the InstructAIService, which interacts with the InstructAIQueryService.
         It also initializes an in-memory database (`local_db`) to store session-based conversation history.
 
+        Args:
+            llm (optional): Chat model to use instead of GPT-4, e.g. a local fake model in tests. It is shared
+                            by the answers, the speculative prefetching and the history compaction.
+
         Attributes:
             instructai_query_service (InstructAIQueryService): An instance of the InstructAIQueryService used for querying.
             local_db (dict): A dictionary storing session-based conversation history.
+            prefetcher (SpeculativePrefetcher): Prefetches the suggested related queries in the background when enabled.
+            history_compactor (HistoryCompactor): Folds older turns of every session into a rolling summary.
         """
-        self.instructai_query_service = InstructAIQueryService()
+        self.instructai_query_service = InstructAIQueryService(llm=llm)
         self.local_db = {}  # In-memory storage for session-based chat history
+        self.prefetcher = SpeculativePrefetcher(self.instructai_query_service.scheduler)
+        self.history_compactor = HistoryCompactor(self.instructai_query_service)
+        self._lock = threading.Lock()
+        self._related_calls_saved = 0  # Related-query calls skipped for low-confidence answers to users
 
     def get_history_by_session_id(self, session_id):
         """
@@ -45,7 +59,8 @@ class InstructAIService:
 
     def update_history(self, session_id, chat_list):
         """
-        Updates the conversation history for a given session ID.
+        Updates the conversation history for a given session ID and folds the turns leaving the
+        verbatim window into the session summary in the background.
 
         Args:
             session_id (str): The session identifier used to update the conversation history.
@@ -59,12 +74,14 @@ class InstructAIService:
                 self.local_db[session_id].extend(chat_list)
             else:
                 self.local_db[session_id] = chat_list
+            self.history_compactor.schedule_update(session_id, self.local_db[session_id])
         except Exception as e:
             logger.error(f"Error updating history for session {session_id}: {e}")
 
     def get_modified_query(self, msg_input: MessageInput):
         """
         Modifies the user's query based on the conversation history for the given session ID.
+        Only the last turns are sent verbatim, along with the rolling summary of the earlier ones.
 
         Args:
             msg_input (MessageInput): The input message containing the query and session ID.
@@ -78,7 +95,8 @@ class InstructAIService:
         try:
             history = self.get_history_by_session_id(msg_input.session_id)
             if len(history) >= 2:
-                modified_query = self.instructai_query_service.get_modified_userquery(msg_input.query, history)
+                summary, recent_history = self.history_compactor.get_context(msg_input.session_id, history)
+                modified_query = self.instructai_query_service.get_modified_userquery(msg_input.query, recent_history, summary=summary)
                 return modified_query
             return msg_input.query
         except Exception as e:
@@ -101,16 +119,49 @@ class InstructAIService:
         """
         try:
             queries_text = self.instructai_query_service.get_related_queries(query, answer)
-            queries_list = queries_text.split('||')
+            queries_list = [related_query.strip() for related_query in queries_text.split('||') if related_query.strip()]
             return queries_list
         except Exception as e:
             logger.error(f"Error generating related queries for '{query}' and answer '{answer}': {e}")
             return []
 
+    def answer_query(self, query, collections=None, metadata_filter=None, results=None, answer=None):
+        """
+        Answers a standalone query and generates its related queries.
+        A low-confidence answer is the fallback one, so it gets no related queries, nor any prefetch.
+
+        Args:
+            query (str): The standalone query.
+            collections (list, optional): Collections to search.
+            metadata_filter (dict, optional): Metadata the retrieved documents must match.
+            results (list, optional): Documents already retrieved for the query by speculative prefetching.
+            answer (dict, optional): Answer already generated for the query by speculative prefetching.
+
+        Returns:
+            dict: A dictionary containing the AI-generated answer, its source documents and a list of related queries.
+        """
+        # Call the InstructAI service to get the answer for the query
+        if answer is None:
+            answer = self.instructai_query_service.query(query, collections=collections, metadata_filter=metadata_filter, results=results)
+        related_queries = []
+        if answer and answer.get("low_confidence"):
+            with self._lock:
+                self._related_calls_saved += 1
+        elif answer:
+            # Related queries are only generated once a query is actually asked, never speculatively
+            related_queries = self.generate_related_queries(query, answer["answer"])
+
+        # Add related queries to the answer
+        answer["rel_queries"] = related_queries
+        return answer
+
     def get_answer_from_query(self, msg_input: MessageInput):
         """
         Queries the InstructAIQueryService with the given query and returns the generated answer along with related queries.
 
+        A query matching a prefetched suggestion reuses its cached retrieval, and its answer when one was prefetched.
+        Once answered, the new suggestions are prefetched in the background when speculative prefetching is enabled.
+
         Args:
             msg_input (MessageInput): The input message containing the query and session ID.
 
@@ -121,20 +172,51 @@ class InstructAIService:
             HTTPException: If an error occurs during query processing or if an error occurs while interacting with the InstructAI service.
         """
         try:
-            _modified_query = self.get_modified_query(msg_input)
-            # Call the InstructAI service to get the answer for the query
-            answer = self.instructai_query_service.query(_modified_query)
-            related_queries = []
-            if answer:
-                related_queries = self.generate_related_queries(_modified_query, answer["answer"])
+            scope = [msg_input.collections, msg_input.filter]
+            prefetched = self.prefetcher.get(msg_input.session_id, msg_input.query, scope=scope)
+            if prefetched is not None:
+                # Suggestions are standalone queries, so they need no reformulation
+                _modified_query = msg_input.query
+                answer = self.answer_query(_modified_query, collections=msg_input.collections, metadata_filter=msg_input.filter,
+                                           results=prefetched["results"], answer=prefetched["answer"])
+            else:
+                _modified_query = self.get_modified_query(msg_input)
+                answer = self.answer_query(_modified_query, collections=msg_input.collections, metadata_filter=msg_input.filter)
 
             # Update the conversation history
             _chat_list = [{"User": _modified_query}, {"AI": answer["answer"]}]
             self.update_history(msg_input.session_id, _chat_list)
 
-            # Add related queries to the answer
-            answer["rel_queries"] = related_queries
+            # Speculatively retrieve, and answer when there is spare capacity, the suggested queries in the background
+            self.prefetcher.schedule(
+                msg_input.session_id,
+                answer["rel_queries"],
+                lambda query: self.instructai_query_service.retrieve(query, collections=msg_input.collections, metadata_filter=msg_input.filter),
+                lambda query, results: self.instructai_query_service.query(query, collections=msg_input.collections, metadata_filter=msg_input.filter,
+                                                                           priority=CallPriority.PREFETCH, results=results),
+                scope=scope
+            )
             return answer
         except Exception as e:
             logger.error(f"Error querying InstructAI for session {msg_input.session_id}: {e}")
             raise HTTPException(status_code=500, detail=f"Error querying InstructAI: {str(e)}")
+
+    def get_stats(self):
+        """
+        Returns the statistics of the LLM call scheduler, the query embedding batcher, the speculative prefetching,
+        the history compaction and the confidence gate. Reformulation prompt tokens are reported by the scheduler.
+
+        Returns:
+            dict: The scheduler, embedding batcher, prefetch, history compaction and confidence gate statistics.
+        """
+        confidence_gate = self.instructai_query_service.get_confidence_stats()
+        with self._lock:
+            confidence_gate["related_calls_saved"] = self._related_calls_saved
+        confidence_gate["llm_calls_saved"] = confidence_gate["short_circuited"] + confidence_gate["related_calls_saved"]
+        return {
+            "llm_scheduler": self.instructai_query_service.scheduler.get_stats(),
+            "embedding_batcher": self.instructai_query_service.vector_db.query_embeddings.get_stats(),
+            "speculative_prefetch": self.prefetcher.get_stats(),
+            "history_compaction": self.history_compactor.get_stats(),
+            "confidence_gate": confidence_gate
+        }